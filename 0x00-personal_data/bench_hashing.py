@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" Concurrent login throughput benchmark of the HashingService
+
+Checks a batch of passwords with verify_many() for several pool sizes,
+and once with the blocking is_valid() called straight from the event
+loop. While the checks run, a ticker coroutine records the longest time
+the event loop was kept from running, which is what a server loop serving
+other requests would feel.
+
+Usage: ./bench_hashing.py [logins] [rounds]
+"""
+import asyncio
+import os
+import sys
+import time
+from encrypt_password import HashingService, hash_password, is_valid
+
+TICK = 0.005
+
+
+async def ticker(stop: asyncio.Event) -> float:
+    """ Returns the longest event loop stall seen until `stop` is set """
+    worst = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        worst = max(worst, time.perf_counter() - start - TICK)
+    return worst
+
+
+async def blocking(pairs: list) -> None:
+    """ Checks the passwords on the event loop itself """
+    for hashed, password in pairs:
+        is_valid(hashed, password)
+        await asyncio.sleep(0)
+
+
+async def measure(check, pairs: list) -> tuple:
+    """ Returns the logins/sec of check(pairs) and the worst stall in ms
+    """
+    stop = asyncio.Event()
+    watch = asyncio.ensure_future(ticker(stop))
+    await asyncio.sleep(TICK)
+    start = time.perf_counter()
+    await check(pairs)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return len(pairs) / elapsed, await watch * 1000
+
+
+async def run(logins: int, rounds: int) -> None:
+    """ Runs every configuration and prints its results """
+    hashed = hash_password('correct horse', rounds)
+    pairs = [(hashed, 'correct horse')] * logins
+    print('{:<16} {:>10} {:>14}'.format('mode', 'logins/s',
+                                        'worst stall ms'))
+    rate, stall = await measure(blocking, pairs)
+    print('{:<16} {:>10.1f} {:>14.1f}'.format('blocking', rate, stall))
+    cpus = os.cpu_count() or 1
+    for workers in sorted({1, cpus, 2 * cpus}):
+        service = HashingService(max_workers=workers)
+        try:
+            rate, stall = await measure(service.verify_many, pairs)
+        finally:
+            service.close()
+        print('{:<16} {:>10.1f} {:>14.1f}'.format(
+            'verify_many/{}'.format(workers), rate, stall))
+
+
+def main():
+    """
+    Command line entry point
+    """
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(run(logins, rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,105 @@
 #!/usr/bin/env python3
 """ Encrypting passwords using bcrypt """
 
+import asyncio
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Iterable, List, Tuple
 
+# bcrypt.gensalt() default cost
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
 
-def hash_password(password: str) -> bytes:
+
+def calibrate_cost(target_ms: float, samples: int = 5) -> int:
+    """
+    Returns the highest bcrypt cost hashing within target_ms on this host
+
+    Each extra round doubles the work, so costs are timed from the
+    minimum upwards until the next one would exceed the target. Each
+    cost is timed `samples` times and judged on the median.
+
+    Args:
+        target_ms (float): the hashing latency to aim for, in milliseconds
+        samples (int): timings taken per cost
+    """
+    rounds = MIN_ROUNDS
+    while rounds < MAX_ROUNDS:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+            timings.append((time.perf_counter() - start) * 1000)
+        if statistics.median(timings) * 2 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+@lru_cache(maxsize=None)
+def _calibrated_cost(target_ms: float) -> int:
+    """ Calibrates once per target latency """
+    return calibrate_cost(target_ms)
+
+
+def target_rounds() -> int:
+    """
+    Returns the bcrypt cost new hashes should use: BCRYPT_ROUNDS if set,
+    else the cost calibrated for BCRYPT_TARGET_MS if set, else the
+    bcrypt default
+
+    BCRYPT_TARGET_MS calibrates in every process, so hosts can settle on
+    different costs. Pin one cost for the whole deployment with
+    BCRYPT_ROUNDS, as printed by `./encrypt_password.py <target_ms>`.
+    """
+    rounds = os.getenv('BCRYPT_ROUNDS')
+    if rounds:
+        return int(rounds)
+    target_ms = os.getenv('BCRYPT_TARGET_MS')
+    if target_ms:
+        return _calibrated_cost(float(target_ms))
+    return DEFAULT_ROUNDS
+
+
+def hash_cost(hashed_password: bytes) -> int:
+    """
+    Returns the cost factor of a bcrypt hash, `$2b$<cost>$...`
+
+    Args:
+        hashed_password (bytes): The hashed version of the password
+    """
+    return int(hashed_password.split(b'$')[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Whether a hash was made with a lower cost than target_rounds()
+
+    Only upgrades are asked for, so processes disagreeing on the target
+    cannot make a password flip back and forth between two costs.
+
+    Args:
+        hashed_password (bytes): The hashed version of the password
+    """
+    return hash_cost(hashed_password) < target_rounds()
+
+
+def hash_password(password: str, rounds: int = None) -> bytes:
     """
     Hashes a string password using bcrypt
 
     Args:
         password (str): the password argument to be hashed
+        rounds (int): the bcrypt cost, target_rounds() by default
     """
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or target_rounds())
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed_password
 
@@ -25,3 +113,133 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
         password (str): The original password
     """
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+class HashingBusy(RuntimeError):
+    """
+    Raised when a HashingService cannot queue more than max_pending jobs
+    """
+
+
+class HashingService:
+    """
+    Runs bcrypt on a thread pool behind an asyncio API
+
+    bcrypt releases the GIL while hashing, so the event loop keeps serving
+    other requests. At most `max_workers` hashes run at once, others wait
+    in line, and jobs that would take the queue beyond `max_pending` are
+    refused with HashingBusy instead of piling up behind a login storm.
+    A batch is admitted or refused as a whole.
+    """
+
+    def __init__(self, max_workers: int = None, max_pending: int = None):
+        """
+        Initializes the service
+
+        Args:
+            max_workers (int): concurrent hashes, the CPU count by default
+            max_pending (int): queued or running jobs before refusing new
+                ones, None for no limit
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix='bcrypt')
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        # Jobs admitted and not finished, released from worker threads
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def _admit(self, count: int) -> None:
+        """ Reserves room for `count` jobs or raises HashingBusy """
+        with self._pending_lock:
+            if self.max_pending is not None and \
+                    self._pending + count > self.max_pending:
+                raise HashingBusy(
+                    '{} hashing jobs pending, {} more refused'.format(
+                        self._pending, count))
+            self._pending += count
+
+    def _start(self, func, *args) -> asyncio.Task:
+        """
+        Runs an admitted bcrypt call on the pool once a slot is free
+
+        The room of the job is freed when the call ends, even if the
+        caller was cancelled meanwhile, or when the task ends if the call
+        never started.
+        """
+        state = {'submitted': False, 'released': False}
+
+        def release(*_):
+            with self._pending_lock:
+                if not state['released']:
+                    state['released'] = True
+                    self._pending -= 1
+
+        async def run():
+            async with self._semaphore:
+                future = self._executor.submit(func, *args)
+                state['submitted'] = True
+                future.add_done_callback(release)
+                return await asyncio.wrap_future(future)
+
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(
+            lambda _: None if state['submitted'] else release())
+        return task
+
+    async def hash_password(self, password: str) -> bytes:
+        """
+        Hashes a string password using bcrypt
+
+        Args:
+            password (str): the password argument to be hashed
+        """
+        self._admit(1)
+        return await self._start(hash_password, password)
+
+    async def is_valid(self, hashed_password: bytes, password: str) -> bool:
+        """
+        Validates that the provided password matches the hashed password
+
+        Args:
+            hashed_password (bytes): The hashed version of the password
+            password (str): The original password
+        """
+        self._admit(1)
+        return await self._start(is_valid, hashed_password, password)
+
+    async def verify_many(self, pairs: Iterable[Tuple[bytes, str]]
+                          ) -> List[bool]:
+        """
+        Validates (hashed_password, password) pairs concurrently
+
+        Args:
+            pairs: the hashed passwords and the passwords to check
+
+        Returns:
+            List[bool]: one result per pair, in order
+
+        Raises:
+            HashingBusy: if the whole batch does not fit in the queue
+        """
+        pairs = list(pairs)
+        self._admit(len(pairs))
+        tasks = [self._start(is_valid, hashed, password)
+                 for hashed, password in pairs]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    def close(self) -> None:
+        """ Waits for the running jobs and stops the pool """
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    # Prints the cost to pin in BCRYPT_ROUNDS for a target latency
+    print('BCRYPT_ROUNDS={}'.format(calibrate_cost(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 250)))
@@ -1,14 +1,26 @@
 #!/usr/bin/env python3
 """ Filtering logs with personal data """
 
+from contextlib import contextmanager
+from functools import lru_cache
 import logging
 import mysql.connector
+from mysql.connector import pooling
 import os
+import queue
 import re
+import sys
+import threading
+import time
+from typing import Pattern, TextIO, Tuple
 
 # Define PII_FIELDS constant
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
+# Shared connection pool, see get_pool()
+DB_POOL = None
+DB_POOL_LOCK = threading.Lock()
+
 
 class RedactingFormatter(logging.Formatter):
     """
@@ -22,12 +34,33 @@ class RedactingFormatter(logging.Formatter):
         """ Initializes the RedactingFormatter class """
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        # Compiled once: every field is redacted in a single scan
+        self._pattern = None
+        if fields:
+            self._pattern = redaction_pattern(tuple(fields), self.SEPARATOR)
+        self._replacement = r'\g<1>=' + self.REDACTION
 
     def format(self, record: logging.LogRecord) -> str:
         """ Returns the formatted data """
         message = super().format(record)
-        return filter_datum(
-            self.fields, self.REDACTION, message, self.SEPARATOR)
+        if self._pattern is None:
+            return message
+        return self._pattern.sub(self._replacement, message)
+
+
+@lru_cache(maxsize=128)
+def redaction_pattern(fields: Tuple[str, ...], separator: str) -> Pattern:
+    """
+    Returns one compiled pattern matching any of the fields with its value,
+    the field name being captured in group 1
+
+    Args:
+        fields (Tuple[str]): the fields to be obfuscated
+        separator (str): the character that separates all fields in the
+            log line
+    """
+    names = '|'.join(fields)
+    return re.compile(f'({names})=[^{re.escape(separator)}]*')
 
 
 def filter_datum(fields: tuple, redaction: str, message: str,
@@ -42,22 +75,133 @@ def filter_datum(fields: tuple, redaction: str, message: str,
         separator (str): the character that separates all fields in the
             log line
     """
-    for field in fields:
-        regex = f'{field}=[^{separator}]*'
-        message = re.sub(regex, f'{field}={redaction}', message)
-    return message
+    if not fields:
+        return message
+    pattern = redaction_pattern(tuple(fields), separator)
+    return pattern.sub(r'\g<1>=' + redaction, message)
 
 
-def get_logger() -> logging.Logger:
+class AsyncRedactingHandler(logging.Handler):
+    """
+    Handler that queues records and formats, redacts and writes them in
+    batches on a background thread, keeping that work and the stream I/O
+    off the logging thread
+
+    When the bounded queue is full, `policy` decides what happens:
+      - "block": the logging thread waits for room
+      - "drop": the record is dropped
+      - "sample": once the queue is half full only one record out of
+        `sample_every` is kept, and records are dropped when it is full
+    Dropped records are counted in `dropped`, which like the sampling
+    counter is only updated under `_counter_lock`.
+    """
+    POLICIES = ("block", "drop", "sample")
+
+    def __init__(self, stream: TextIO = None, capacity: int = 10000,
+                 policy: str = "drop", batch_size: int = 256,
+                 sample_every: int = 10):
+        """ Initializes the handler and starts its worker thread """
+        super(AsyncRedactingHandler, self).__init__()
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown queue policy: {policy}')
+        self.stream = stream if stream is not None else sys.stderr
+        self.policy = policy
+        self.batch_size = batch_size
+        self.sample_every = sample_every
+        self.dropped = 0
+        self._seen = 0
+        self._counter_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=capacity)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """ Queues a record according to the queue policy """
+        if self.policy == "block":
+            self._queue.put(record)
+            return
+        if self.policy == "sample" and \
+                self._queue.qsize() * 2 >= self._queue.maxsize:
+            with self._counter_lock:
+                self._seen += 1
+                sampled_out = self._seen % self.sample_every
+                if sampled_out:
+                    self.dropped += 1
+            if sampled_out:
+                return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+
+    def _run(self) -> None:
+        """ Worker loop: formats and writes the queued records in batches """
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for record in batch:
+                if record is None:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except Exception:
+                    self.handleError(batch[-1])
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self) -> None:
+        """ Waits until every queued record has been written """
+        if self._worker.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """ Writes the queued records and stops the worker thread """
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+        super(AsyncRedactingHandler, self).close()
+
+
+def get_logger(asynchronous: bool = None,
+               policy: str = None) -> logging.Logger:
     """
     Returns a logging.Logger object
+
+    Args:
+        asynchronous (bool): redact and write log records on a background
+            thread, see AsyncRedactingHandler. Defaults to the
+            PERSONAL_DATA_LOG_ASYNC environment variable being "1".
+        policy (str): queue policy of the asynchronous handler, defaults
+            to PERSONAL_DATA_LOG_POLICY or "drop"
     """
     user_data = logging.getLogger()
     user_data.setLevel(logging.INFO)
     user_data.propagate = False
 
-    # Create StreamHandler with RedactingFormatter
-    stream_handler = logging.StreamHandler()
+    if asynchronous is None:
+        asynchronous = os.getenv("PERSONAL_DATA_LOG_ASYNC") == "1"
+    if asynchronous:
+        stream_handler = AsyncRedactingHandler(
+            policy=policy or os.getenv("PERSONAL_DATA_LOG_POLICY", "drop"))
+    else:
+        # Create StreamHandler with RedactingFormatter
+        stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(RedactingFormatter(fields=PII_FIELDS))
 
     # Add StreamHandler to logger
@@ -66,50 +210,127 @@ def get_logger() -> logging.Logger:
     return user_data
 
 
+def get_pool() -> pooling.MySQLConnectionPool:
+    """
+    Returns the shared pool of connections to the MySQL database, created
+    on first use with the credentials stored in the environment variables
+
+    PERSONAL_DATA_DB_POOL_SIZE sets the number of pooled connections
+    (5 by default, at most 32).
+    """
+    global DB_POOL
+    with DB_POOL_LOCK:
+        if DB_POOL is None:
+            DB_POOL = pooling.MySQLConnectionPool(
+                pool_name="personal_data",
+                pool_size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", 5)),
+                host=os.getenv("PERSONAL_DATA_DB_HOST", "localhost"),
+                user=os.getenv("PERSONAL_DATA_DB_USERNAME", "root"),
+                password=os.getenv("PERSONAL_DATA_DB_PASSWORD", ""),
+                database=os.getenv("PERSONAL_DATA_DB_NAME")
+            )
+        return DB_POOL
+
+
 def get_db():
     """
     Returns a connection to the MySQL database using the credentials
     stored in the environment variables
+
+    The connection is checked out of the shared pool and closing it gives
+    it back. The pool reconnects stale connections on checkout, and
+    failures (server down, pool exhausted) are retried
+    PERSONAL_DATA_DB_RETRIES times (3 by default) with an exponential
+    backoff starting at PERSONAL_DATA_DB_BACKOFF seconds (0.1 by
+    default). None is returned if every attempt failed.
+    """
+    retries = max(0, int(os.getenv("PERSONAL_DATA_DB_RETRIES", 3)))
+    backoff = float(os.getenv("PERSONAL_DATA_DB_BACKOFF", 0.1))
+
+    for attempt in range(retries + 1):
+        try:
+            return get_pool().get_connection()
+        except mysql.connector.Error as err:
+            error = err
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt)
+    print('Error connecting to DB: ', error)
+
+
+@contextmanager
+def pooled_connection():
     """
-    username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
-    password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
-    host = os.getenv("PERSONAL_DATA_DB_HOST", "localhost")
-    dbname = os.getenv("PERSONAL_DATA_DB_NAME")
+    Yields a pooled connection, given back to the pool on exit
 
-    # Connect with mysql database
+    Raises:
+        mysql.connector.Error: if no connection could be obtained
+    """
+    db = get_db()
+    if db is None:
+        raise mysql.connector.Error("Could not connect to the database")
     try:
-        db = mysql.connector.connect(
-            host=host, user=username, password=password, database=dbname
-        )
-        return db
-    except mysql.connector.Error as err:
-        print('Error connecting to DB: ', err)
+        yield db
+    finally:
+        db.close()
+
+
+def export_users(db_connection, logger: logging.Logger,
+                 batch_size: int = 1000) -> int:
+    """
+    Streams the users table to a redacting logger in constant memory
+
+    Rows are read `batch_size` at a time from an unbuffered cursor, so
+    the server streams the result instead of the client holding it all,
+    and each row is logged as soon as it is read. Any DB-API connection
+    works, e.g. a sqlite3 one standing in for MySQL.
+
+    Args:
+        db_connection: an open DB-API connection
+        logger (logging.Logger): logger redacting PII, see get_logger()
+        batch_size (int): number of rows fetched per round-trip
+
+    Returns:
+        int: the number of rows exported
+    """
+    cursor = db_connection.cursor()
+    count = 0
+    try:
+        cursor.execute('SELECT * FROM users')
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                logger.info(' '.join(
+                    f'{column}={value};' for column, value in
+                    zip(columns, row)))
+                count += 1
+    finally:
+        cursor.close()
+    return count
 
 
 def main():
     """
     Main function to retrieve and filter data from the users table
     """
-    # Configure logger
-    logging.basicConfig(
-        level=logging.INFO,
-        format='[HOLBERTON] user_data %(levelname)s %(asctime)s: %(message)s')
     # Obtain database connection
     db_connection = get_db()
+    if db_connection is None:
+        return
 
-    # Retrieve all rows from users table
-    cursor = db_connection.cursor(dictionary=False)
-    cursor.execute('SELECT * FROM users')
-    rows = cursor.fetchall()
-
-    for row in rows:
-        filtered_row = {key: '***' if key in PII_FIELDS else value for
-                        key, value in row.items()}
-        logging.info(filtered_row)
-
-        # Close cursor and database connection
-        cursor.close()
+    # Stream the users table through the redacting logger. An export
+    # must not lose rows, so a full queue blocks instead of dropping
+    logger = get_logger(policy="block")
+    try:
+        export_users(db_connection, logger)
+    finally:
         db_connection.close()
+        for handler in list(logger.handlers):
+            handler.flush()
+            handler.close()
+            logger.removeHandler(handler)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+""" Scrubbing PII from existing log files in parallel """
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+import time
+from typing import BinaryIO, List, Tuple
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def chunk_ranges(path: str, chunk_size: int = CHUNK_SIZE
+                 ) -> List[Tuple[int, int]]:
+    """
+    Splits a file into (start, end) byte ranges of about chunk_size bytes
+    that end on line boundaries
+
+    Args:
+        path (str): the file to split
+        chunk_size (int): the target size of a range in bytes
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def scrub_chunk(path: str, start: int, end: int, fields: tuple,
+                redaction: str, separator: str) -> bytes:
+    """
+    Returns the redacted bytes of a range of a log file
+
+    The newline is added to the separators so that each line is redacted
+    exactly as filter_datum would redact it on its own.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    text = data.decode('utf-8', errors='surrogateescape')
+    text = filter_datum(fields, redaction, text, separator + '\n')
+    return text.encode('utf-8', errors='surrogateescape')
+
+
+def scrub_file(path: str, output: BinaryIO, fields: tuple = PII_FIELDS,
+               workers: int = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Redacts a log file with a process pool and writes it in order
+
+    At most two chunks per worker are in flight, so memory stays bounded
+    whatever the size of the file.
+
+    Args:
+        path (str): the log file to scrub
+        output (BinaryIO): where the scrubbed lines are written
+        fields (tuple): the fields to be obfuscated
+        workers (int): number of processes, defaults to the CPU count
+        chunk_size (int): the target size of a chunk in bytes
+
+    Returns:
+        dict: bytes, lines, seconds and MB/s of the run
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.time()
+    total = lines = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in chunk_ranges(path, chunk_size):
+            pending.append(executor.submit(
+                scrub_chunk, path, start, end, tuple(fields),
+                RedactingFormatter.REDACTION, RedactingFormatter.SEPARATOR))
+            total += end - start
+            if len(pending) >= 2 * workers:
+                lines += _write(output, pending.popleft().result())
+        while pending:
+            lines += _write(output, pending.popleft().result())
+    output.flush()
+    seconds = time.time() - started
+    return {
+        'bytes': total,
+        'lines': lines,
+        'seconds': seconds,
+        'mb_per_second': total / (1024 * 1024) / seconds if seconds else 0,
+    }
+
+
+def _write(output: BinaryIO, data: bytes) -> int:
+    """ Writes a scrubbed chunk and returns its number of lines """
+    output.write(data)
+    return data.count(b'\n')
+
+
+def main():
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Redact PII fields from log files in parallel')
+    parser.add_argument('input', help='log file to scrub')
+    parser.add_argument('-o', '--output',
+                        help='scrubbed file to write, standard output '
+                             'by default')
+    parser.add_argument('-j', '--workers', type=int,
+                        help='number of worker processes')
+    parser.add_argument('-c', '--chunk-size', type=int, default=8,
+                        help='chunk size in MiB')
+    parser.add_argument('-f', '--fields', default=','.join(PII_FIELDS),
+                        help='comma separated fields to redact')
+    args = parser.parse_args()
+
+    fields = tuple(field for field in args.fields.split(',') if field)
+    chunk_size = args.chunk_size * 1024 * 1024
+    if args.output:
+        with open(args.output, 'wb') as output:
+            stats = scrub_file(args.input, output, fields, args.workers,
+                               chunk_size)
+    else:
+        stats = scrub_file(args.input, sys.stdout.buffer, fields,
+                           args.workers, chunk_size)
+    print('Scrubbed {lines} lines ({bytes} bytes) in {seconds:.2f}s, '
+          '{mb_per_second:.1f} MB/s'.format(**stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
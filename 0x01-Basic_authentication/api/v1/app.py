@@ -3,6 +3,7 @@
 Route module for the API
 """
 
+from api.v1.auth.path_matcher import PathMatcher
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request, Response
 from flask_cors import (CORS, cross_origin)
@@ -15,6 +16,13 @@ app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
 
+# Paths served without authentication, compiled once for require_auth
+EXCLUDED_PATHS = frozenset([
+    '/api/v1/status/', '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+])
+EXCLUDED_PATHS_MATCHER = PathMatcher(EXCLUDED_PATHS)
+
 auth_type = os.getenv('AUTH_TYPE')
 if auth_type:
     if auth_type == 'Auth':
@@ -24,6 +32,12 @@ if auth_type:
         from api.v1.auth.basic_auth import BasicAuth
         auth = BasicAuth()
 
+group_commit_interval = os.getenv('DB_GROUP_COMMIT_INTERVAL')
+if group_commit_interval:
+    # Let concurrent requests share file writes of the models store
+    from models.base import GroupCommit
+    GroupCommit(interval=float(group_commit_interval)).start()
+
 
 @app.before_request
 def before_request() -> Union[str, None]:
@@ -33,13 +47,8 @@ def before_request() -> Union[str, None]:
     if auth is None:
         return None
 
-    excluded_paths = [
-        '/api/v1/status/', '/api/v1/unauthorized/',
-        '/api/v1/forbidden/',
-    ]
-    if request.path not in excluded_paths:
-        return None
-    if not auth.require_auth(request.path, excluded_paths):
+    if not auth.require_auth(request.path, EXCLUDED_PATHS_MATCHER,
+                             request.method):
         return None
     if auth.authorization_header(request) is None:
         return abort(401)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compiled path rules module
+"""
+from typing import Iterable, Union
+
+
+class _Node:
+    """
+    Trie node, one per rule character
+    """
+    __slots__ = ('children', 'star', 'loop', 'exact', 'prefix')
+
+    def __init__(self, loop: bool = False):
+        """ Initializes an empty node """
+        self.children = {}
+        # Node reached through a `*` inside a rule, looping on itself
+        self.star = None
+        self.loop = loop
+        # Methods of the rules ending here / ending here with a final `*`
+        self.exact = set()
+        self.prefix = set()
+
+
+class PathMatcher:
+    """
+    Set of path rules compiled once into a character trie
+
+    Rules are written like the `excluded_paths` of Auth.require_auth,
+    optionally preceded by HTTP methods:
+      - `/api/v1/status/` matches that path only
+      - `/api/v1/stat*` matches every path starting with `/api/v1/stat`
+      - `/api/v1/users/*/` matches any single path segment in place of
+        the inner `*`
+      - `GET,HEAD /api/v1/users/` only matches for these methods
+
+    Matching walks the path once, so its cost depends on the path length
+    and the number of inner wildcards, not on the number of rules.
+    """
+    ANY_METHOD = '*'
+
+    def __init__(self, rules: Iterable[str] = ()):
+        """ Compiles the rules """
+        self._root = _Node()
+        self.rules = []
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: str) -> None:
+        """ Adds a rule to the trie """
+        self.rules.append(rule)
+        methods = {self.ANY_METHOD}
+        if ' ' in rule:
+            verbs, rule = rule.split(' ', 1)
+            methods = {verb.strip().upper() for verb in verbs.split(',')}
+        prefix = rule.endswith('*')
+        if prefix:
+            rule = rule[:-1]
+        node = self._root
+        for char in rule:
+            if char == '*':
+                if node.star is None:
+                    node.star = _Node(loop=True)
+                node = node.star
+                continue
+            node = node.children.setdefault(char, _Node())
+        (node.prefix if prefix else node.exact).update(methods)
+
+    @staticmethod
+    def _allows(methods: set, method: Union[str, None]) -> bool:
+        """ Whether a rule method set covers a request method """
+        if not methods:
+            return False
+        return (PathMatcher.ANY_METHOD in methods or method is None or
+                method.upper() in methods)
+
+    @staticmethod
+    def _closure(node: _Node, states: list) -> None:
+        """ Adds a node and the inner wildcards it leads to """
+        while node is not None:
+            if node not in states:
+                states.append(node)
+            node = node.star
+
+    def match(self, path: str, method: str = None) -> bool:
+        """ Whether a rule matches the path (and method, if given) """
+        states = []
+        self._closure(self._root, states)
+        for char in path:
+            following = []
+            for node in states:
+                if self._allows(node.prefix, method):
+                    return True
+                child = node.children.get(char)
+                if child is not None:
+                    self._closure(child, following)
+                if node.loop and char != '/':
+                    self._closure(node, following)
+            if not following:
+                return False
+            states = following
+        return any(self._allows(node.exact, method) or
+                   self._allows(node.prefix, method) for node in states)
+
+    def __len__(self) -> int:
+        """ Number of rules """
+        return len(self.rules)
@@ -2,18 +2,69 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, jsonify, request, Response
 from models.user import User
+from typing import Iterator
+import json
+
+
+MAX_PAGE_SIZE = 1000
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users to return, pages are ordered by ID
+      - cursor: value of the X-Next-Cursor header of the previous page
+      - stream: `1` to stream the JSON list while it is generated
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or one page of it
+        with the cursor of the next page in X-Next-Cursor
+      - 400 if limit is not a positive integer
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream') == '1'
+    if limit is None and cursor is None and not stream:
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    if stream:
+        return Response(_stream_users(limit, cursor),
+                        mimetype='application/json')
+
+    users, next_cursor = User.page(min(limit or MAX_PAGE_SIZE,
+                                       MAX_PAGE_SIZE), cursor)
+    response = jsonify([user.to_json() for user in users])
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+def _stream_users(limit: int = None, cursor: str = None) -> Iterator[str]:
+    """ Yield a JSON list of users chunk by chunk, reading the store one
+    page at a time so memory stays bounded
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    yield '['
+    sent = 0
+    while limit is None or sent < limit:
+        size = MAX_PAGE_SIZE if limit is None \
+            else min(MAX_PAGE_SIZE, limit - sent)
+        users, cursor = User.page(size, cursor)
+        for user in users:
+            yield (',' if sent else '') + json.dumps(user.to_json())
+            sent += 1
+        if cursor is None:
+            break
+    yield ']'
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+""" Verify latency benchmark of the password hashers
+
+Times, for each available hasher, a verification of a correct password
+done by the hasher itself (uncached) and through check_password() once
+the result is in the verification cache (cached). bcrypt is only timed
+when the bcrypt package is installed.
+
+Usage: ./bench_hashers.py [verifications]
+"""
+import sys
+import time
+from typing import Callable
+from models import hashers
+
+PASSWORD = 'correct horse battery staple'
+
+
+def per_call(func: Callable, count: int) -> float:
+    """ Returns the mean time of func(), in ms """
+    start = time.perf_counter()
+    for _ in range(count):
+        assert func()
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    """
+    Command line entry point
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    available = [hashers.LEGACY_HASHER] + [
+        hashers.HASHERS[name] for name in sorted(hashers.HASHERS)]
+    print('{:<14} {:>14} {:>12}'.format('hasher', 'uncached ms',
+                                        'cached ms'))
+    for hasher in available:
+        encoded = hasher.encode(PASSWORD)
+        uncached = per_call(lambda: hasher.verify(PASSWORD, encoded), count)
+        hashers.check_password(PASSWORD, encoded)
+        cached = per_call(
+            lambda: hashers.check_password(PASSWORD, encoded), 1000)
+        print('{:<14} {:>14.3f} {:>12.4f}'.format(
+            hasher.name, uncached, cached))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+""" Memory benchmark of the models
+
+Loads users from JSON records, as load_from_file() does, and measures
+with tracemalloc the bytes each one takes: once as User, with its
+__slots__, and once as a plain class laid out like the former Base, with
+a per-instance __dict__ and its own updated_at datetime.
+
+Usage: ./bench_memory.py [users]
+"""
+from datetime import datetime
+import sys
+import tracemalloc
+import uuid
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+class DictUser():
+    """ User laid out like before __slots__
+    """
+
+    def __init__(self, **kwargs: dict):
+        """ Initialize from a JSON record
+        """
+        self.id = kwargs.get('id')
+        self.created_at = datetime.strptime(kwargs.get('created_at'),
+                                            TIMESTAMP_FORMAT)
+        self.updated_at = datetime.strptime(kwargs.get('updated_at'),
+                                            TIMESTAMP_FORMAT)
+        self.email = kwargs.get('email')
+        self._password = kwargs.get('_password')
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+
+
+def make_records(count: int) -> list:
+    """ Returns `count` JSON records of users
+    """
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    return [{
+        'id': str(uuid.uuid4()),
+        'created_at': now,
+        'updated_at': now,
+        'email': 'user{}@example.com'.format(i),
+        '_password': 'pbkdf2_sha256$600000${:022d}${:043d}'.format(i, i),
+        'first_name': 'First{}'.format(i),
+        'last_name': 'Last{}'.format(i),
+    } for i in range(count)]
+
+
+def bytes_per_object(cls, records: list) -> float:
+    """ Returns the bytes allocated per object built from the records
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objs = [cls(**record) for record in records]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # The list holding the objects is not part of their cost
+    size -= sys.getsizeof(objs)
+    return size / len(objs)
+
+
+def main():
+    """
+    Command line entry point
+    """
+    from models.user import User
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    records = make_records(count)
+    for name, cls in (('__dict__', DictUser), ('__slots__', User)):
+        print('{:<10} {:>6.0f} bytes per user'.format(
+            name, bytes_per_object(cls, records)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" Microbenchmark of the excluded path rules
+
+Builds rule sets of growing size, mixing exact paths, prefixes, inner
+wildcards and method lists, and times a require_auth() check against the
+compiled PathMatcher and against the former linear scan of the list.
+The scan only understands exact and prefix rules, so it is given those
+alone.
+
+Usage: ./bench_path_matcher.py [rule counts...]
+"""
+import random
+import sys
+import time
+from typing import Callable, List
+from api.v1.auth.auth import Auth
+from api.v1.auth.path_matcher import PathMatcher
+
+CHECKS = 2000
+
+
+def linear_require_auth(path: str, excluded_paths: List[str]) -> bool:
+    """ The former require_auth(), one comparison per rule """
+    path = path.rstrip('/') + '/'
+    for excluded_path in excluded_paths:
+        if excluded_path.endswith('*'):
+            if path.startswith(excluded_path[:-1]):
+                return False
+        elif path == excluded_path:
+            return False
+    return True
+
+
+def make_rules(count: int) -> List[str]:
+    """ Returns `count` rules of every kind """
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            rules.append('/api/v1/resource{}/'.format(i))
+        elif kind == 1:
+            rules.append('/api/v1/static{}/*'.format(i))
+        elif kind == 2:
+            rules.append('/api/v1/items{}/*/details/'.format(i))
+        else:
+            rules.append('GET,HEAD /api/v1/public{}/'.format(i))
+    return rules
+
+
+def make_paths(count: int) -> List[str]:
+    """ Returns request paths, half of them excluded by some rule """
+    rng = random.Random(count)
+    paths = []
+    for _ in range(CHECKS):
+        i = rng.randrange(count)
+        if rng.random() < 0.5:
+            paths.append('/api/v1/users/{}'.format(i))
+        else:
+            paths.append(['/api/v1/resource{}', '/api/v1/static{}/a.css',
+                          '/api/v1/items{}/42/details',
+                          '/api/v1/public{}'][i % 4].format(i))
+    return paths
+
+
+def per_check(func: Callable, paths: List[str]) -> float:
+    """ Returns the mean time of func(path), in us """
+    start = time.perf_counter()
+    for path in paths:
+        func(path)
+    return (time.perf_counter() - start) / len(paths) * 1e6
+
+
+def main():
+    """
+    Command line entry point
+    """
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 10000]
+    auth = Auth()
+    print('{:>7} {:>12} {:>12}'.format('rules', 'linear (us)',
+                                       'trie (us)'))
+    for count in counts:
+        rules = make_rules(count)
+        paths = make_paths(count)
+        matcher = PathMatcher(rules)
+        simple = [rule for rule in rules if '*' not in rule[:-1] and
+                  ' ' not in rule]
+        linear = per_check(lambda p: linear_require_auth(p, simple), paths)
+        trie = per_check(
+            lambda p: auth.require_auth(p, matcher, 'GET'), paths)
+        print('{:>7,} {:>12.1f} {:>12.1f}'.format(count, linear, trie))
+
+
+if __name__ == "__main__":
+    main()
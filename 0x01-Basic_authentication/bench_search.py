@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Search latency benchmark of the models
+
+Loads stores of growing size from a snapshot file in a scratch
+directory and times User.search() on the indexed email attribute, which
+should stay flat, and on the unindexed first_name, which scans.
+
+Usage: ./bench_search.py [store sizes...]
+"""
+from datetime import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+LOOKUPS = 1000
+# Scans are slow on large stores, fewer of them are timed
+SCANS = 10
+
+
+def write_snapshot(count: int) -> None:
+    """ Writes a User snapshot of `count` users in the current directory
+    """
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    users = {}
+    for i in range(count):
+        obj_id = '{:032x}'.format(i)
+        users[obj_id] = {
+            'id': obj_id, 'created_at': now, 'updated_at': now,
+            'email': 'user{}@example.com'.format(i),
+            'first_name': 'First{}'.format(i),
+        }
+    with open('.db_User.json', 'w') as f:
+        json.dump(users, f)
+
+
+def latency(attribute: str, count: int, lookups: int) -> float:
+    """ Returns the mean latency of a search on `attribute`, in us
+    """
+    from models.user import User
+    rng = random.Random(count)
+    values = [{'email': 'user{}@example.com', 'first_name': 'First{}'}[
+        attribute].format(rng.randrange(count)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for value in values:
+        assert len(User.search({attribute: value})) == 1
+    return (time.perf_counter() - start) / lookups * 1e6
+
+
+def main():
+    """
+    Command line entry point
+    """
+    from models.user import User
+    sizes = [int(arg) for arg in sys.argv[1:]] or \
+        [1000, 10000, 100000, 1000000]
+    print('{:>9} {:>14} {:>14}'.format('users', 'email (us)',
+                                       'first_name (us)'))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for count in sizes:
+                write_snapshot(count)
+                User.load_from_file()
+                print('{:>9,} {:>14.1f} {:>14.1f}'.format(
+                    count, latency('email', count, LOOKUPS),
+                    latency('first_name', count, SCANS)))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
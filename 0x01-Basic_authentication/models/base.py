@@ -1,20 +1,66 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from datetime import datetime
 from typing import TypeVar, List, Iterable
+from models.storage import SQLiteStorage
 from os import path
 import json
+import os
+import threading
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+# Secondary indexes: INDEXES[class][attribute][value] = {id: object}
+INDEXES = {}
+# Values each object is currently indexed under, keyed by class and id
+INDEXED_VALUES = {}
+# Sorted IDs of each class for Base.page(), built on first use
+ORDERED_IDS = {}
+# Mutations not written to disk yet, in the order they were applied
+PENDING = {}
+# Number of records appended to each class journal since the last compaction
+JOURNAL_SIZES = {}
+# Attribute names declared in __slots__ along each class MRO
+SLOT_NAMES = {}
+# Per-class locks, see Base._locks()
+LOCKS = {}
+LOCKS_GUARD = threading.Lock()
+# Per-thread classes touched inside Base.batch(), flushed when it exits
+BATCH = threading.local()
+# Running GroupCommit flusher, if any
+GROUP_COMMIT = None
 
 
 class Base():
     """ Base class
+
+    Writers of a class serialize on its `data` lock only while they
+    mutate DATA and the indexes; disk I/O happens under the `file` lock
+    afterwards. Readers take no lock and work on a copy of the values,
+    so they never wait for a write.
+
+    Attributes live in __slots__ rather than a per-instance __dict__;
+    subclasses declaring their own __slots__ stay dict-free, the others
+    get a __dict__ as usual. Name-mangled slots are internal state and
+    are never serialized.
     """
+    __slots__ = ('id', 'created_at', 'updated_at', '__json')
+
+    # Attributes with a hash index maintained by save/remove/load
+    INDEXED_ATTRIBUTES = ()
+    # Append save/remove records to a journal instead of rewriting the file
+    JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', '0') == '1'
+    # Journal length that triggers a background compaction
+    JOURNAL_COMPACT_THRESHOLD = int(os.getenv('DB_JOURNAL_COMPACT', 1000))
+    # Backend replacing the JSON files, objects then load lazily and DATA
+    # only caches the ones materialized so far
+    STORAGE = SQLiteStorage() if os.getenv('DB_STORAGE') == 'sqlite' \
+        else None
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -22,6 +68,8 @@ class Base():
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
+        if INDEXES.get(s_class) is None:
+            self.__class__._reset_indexes()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
@@ -29,7 +77,10 @@ class Base():
                                                 TIMESTAMP_FORMAT)
         else:
             self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
+        if kwargs.get('updated_at') == kwargs.get('created_at'):
+            # Same instant: share the datetime object instead of a copy
+            self.updated_at = self.created_at
+        elif kwargs.get('updated_at') is not None:
             self.updated_at = datetime.strptime(kwargs.get('updated_at'),
                                                 TIMESTAMP_FORMAT)
         else:
@@ -44,67 +95,341 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and drop the memoized JSON dictionaries
+
+        Setting an indexed attribute of a stored object re-indexes it
+        right away, so search() sees the new value before save().
+        """
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_Base__json', None)
+        cls = self.__class__
+        if name in cls.INDEXED_ATTRIBUTES and cls.STORAGE is None:
+            stored = DATA.get(cls.__name__, {})
+            if stored.get(getattr(self, 'id', None)) is self:
+                with cls._locks()['data']:
+                    if stored.get(self.id) is self:
+                        cls._index_add(self)
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+
+        Both forms are memoized until an attribute is set again, so
+        unchanged objects are not re-serialized by list responses and
+        file writes. Callers get their own copy.
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
+        cache = getattr(self, '_Base__json', None)
+        if cache is None:
+            full = {}
+            for key, value in self._attributes():
+                if type(value) is datetime:
+                    full[key] = value.strftime(TIMESTAMP_FORMAT)
+                else:
+                    full[key] = value
+            public = {k: v for k, v in full.items() if k[0] != '_'}
+            cache = (public, full)
+            object.__setattr__(self, '_Base__json', cache)
+        public, full = cache
+        return dict(full if for_serialization else public)
+
+    def _attributes(self) -> Iterable[tuple]:
+        """ Yield the (name, value) pairs of the attributes set on the
+        object, slots first
+        """
+        cls = self.__class__
+        names = SLOT_NAMES.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get('__slots__', ()):
+                    if name.startswith('__') or name in names:
+                        continue
+                    names.append(name)
+            names = SLOT_NAMES[cls] = tuple(names)
+        for name in names:
+            try:
+                yield name, getattr(self, name)
+            except AttributeError:
                 continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        yield from getattr(self, '__dict__', {}).items()
+
+    @classmethod
+    def _locks(cls) -> dict:
+        """ Return the locks of the class:
+          - data: guards DATA, the indexes and the pending records
+          - file: serializes writes to the snapshot and journal files
+          - snapshot: held while a snapshot is rewritten
+        """
+        s_class = cls.__name__
+        locks = LOCKS.get(s_class)
+        if locks is None:
+            with LOCKS_GUARD:
+                locks = LOCKS.setdefault(s_class, {
+                    'data': threading.RLock(),
+                    'file': threading.Lock(),
+                    'snapshot': threading.Lock(),
+                })
+        return locks
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal on top
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        locks = cls._locks()
+        if cls.STORAGE is not None:
+            with locks['file'], locks['data']:
+                DATA[s_class] = {}
+                PENDING[s_class] = []
+                cls._reset_indexes()
+                cls.STORAGE.open(cls)
             return
+        with locks['file'], locks['data']:
+            DATA[s_class] = {}
+            PENDING[s_class] = []
+            cls._reset_indexes()
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        obj = cls(**obj_json)
+                        DATA[s_class][obj_id] = obj
+                        cls._index_add(obj)
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+            replayed = 0
+            journal_path = ".db_{}.journal".format(s_class)
+            for file_path in (journal_path + ".old", journal_path):
+                if not path.exists(file_path):
+                    continue
+                with open(file_path, 'rb+') as f:
+                    offset = 0
+                    for line in f:
+                        try:
+                            if not line.endswith(b"\n"):
+                                raise ValueError
+                            record = json.loads(line)
+                        except ValueError:
+                            # Torn write: cut it so new records stay readable
+                            f.truncate(offset)
+                            break
+                        cls._replay(record)
+                        offset += len(line)
+                        replayed += 1
+            JOURNAL_SIZES[s_class] = replayed
+        if cls.JOURNAL_MODE and replayed >= cls.JOURNAL_COMPACT_THRESHOLD:
+            cls._compact_in_background()
+
+    @classmethod
+    def _replay(cls, record: dict):
+        """ Apply one journal record to the in-memory store
+        """
+        s_class = cls.__name__
+        if record['op'] == 'save':
+            obj = cls(**record['obj'])
+            DATA[s_class][obj.id] = obj
+            cls._index_add(obj)
+        elif DATA[s_class].pop(record['id'], None) is not None:
+            cls._index_discard(record['id'])
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
+        if cls.STORAGE is not None:
+            cls._flush()
+            return
+        locks = cls._locks()
+        with locks['snapshot']:
+            cls._write_snapshot()
+
+    @classmethod
+    def _write_snapshot(cls):
+        """ Atomically rewrite the snapshot file and drop the journaled
+        records it now contains
+
+        The journal is rotated to `.old` under the file lock, so saves
+        keep appending to a fresh journal while the snapshot is written.
+        Must be called with the snapshot lock held.
+        """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        rotated_path = journal_path + ".old"
+        locks = cls._locks()
+        with locks['file']:
+            with locks['data']:
+                objs = dict(DATA[s_class])
+                if not cls.JOURNAL_MODE:
+                    # The snapshot covers every pending mutation
+                    PENDING[s_class] = []
+            if path.exists(journal_path):
+                if path.exists(rotated_path):
+                    with open(journal_path, 'r') as src, \
+                            open(rotated_path, 'a') as dst:
+                        dst.write(src.read())
+                    os.remove(journal_path)
+                else:
+                    os.replace(journal_path, rotated_path)
+            JOURNAL_SIZES[s_class] = 0
+
         objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
+        for obj_id, obj in objs.items():
             objs_json[obj_id] = obj.to_json(True)
 
-        with open(file_path, 'w') as f:
+        tmp_path = "{}.{}.tmp".format(file_path, threading.get_ident())
+        with open(tmp_path, 'w') as f:
             json.dump(objs_json, f)
+            if cls.JOURNAL_MODE:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        if path.exists(rotated_path):
+            os.remove(rotated_path)
+
+    @classmethod
+    def _journal_append(cls, records: List[dict]):
+        """ Append records to the journal of the class and make them
+        durable, compacting in the background once it grows too long
+
+        Must be called with the file lock held.
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with open(journal_path, 'a') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + len(records)
+        if JOURNAL_SIZES[s_class] >= cls.JOURNAL_COMPACT_THRESHOLD:
+            cls._compact_in_background()
+
+    @classmethod
+    def _compact_in_background(cls):
+        """ Fold the journal into the snapshot on a daemon thread, unless
+        a snapshot is already being written
+        """
+        def _compact():
+            lock = cls._locks()['snapshot']
+            if not lock.acquire(blocking=False):
+                return
+            try:
+                cls._write_snapshot()
+            finally:
+                lock.release()
+
+        threading.Thread(target=_compact, daemon=True).start()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with self._locks()['data']:
+            self.updated_at = datetime.utcnow()
+            DATA[s_class][self.id] = self
+            self.__class__._index_add(self)
+            if self.STORAGE is not None:
+                self.STORAGE.stage(self.__class__, self.id,
+                                   self.to_json(True))
+            else:
+                record = None
+                if self.JOURNAL_MODE:
+                    record = {'op': 'save', 'obj': self.to_json(True)}
+                PENDING.setdefault(s_class, []).append(record)
+        self.__class__._persist()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        with self._locks()['data']:
+            if self.STORAGE is not None:
+                if self.__class__.get(self.id) is None:
+                    return
+                DATA[s_class].pop(self.id, None)
+                self.__class__._index_discard(self.id)
+                self.STORAGE.stage(self.__class__, self.id, None)
+            else:
+                if DATA[s_class].get(self.id) is None:
+                    return
+                del DATA[s_class][self.id]
+                self.__class__._index_discard(self.id)
+                record = None
+                if self.JOURNAL_MODE:
+                    record = {'op': 'remove', 'id': self.id}
+                PENDING.setdefault(s_class, []).append(record)
+        self.__class__._persist()
+
+    @classmethod
+    def _persist(cls):
+        """ Write the pending mutations of the class, now or through the
+        active batch or group commit
+        """
+        touched = getattr(BATCH, 'touched', None)
+        if touched is not None:
+            touched.add(cls)
+            return
+        if GROUP_COMMIT is not None and GROUP_COMMIT.running:
+            GROUP_COMMIT.submit(cls)
+            return
+        cls._flush()
+
+    @classmethod
+    def _flush(cls):
+        """ Write every pending mutation of the class in one go
+
+        Whoever gets the file lock writes the mutations queued by all
+        threads, in the order they were applied, so a writer that finds
+        nothing pending knows an earlier flush already covered it.
+        """
+        s_class = cls.__name__
+        if cls.STORAGE is not None:
+            with cls._locks()['file']:
+                cls.STORAGE.flush(cls)
+            return
+        if not cls.JOURNAL_MODE:
+            with cls._locks()['snapshot']:
+                if PENDING.get(s_class):
+                    cls._write_snapshot()
+            return
+        locks = cls._locks()
+        with locks['file']:
+            with locks['data']:
+                records = PENDING.get(s_class)
+                PENDING[s_class] = []
+            if records:
+                cls._journal_append(records)
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """ Defer the persistence of every save/remove made by this
+        thread inside the block to a single flush per class on exit
+
+        Usage:
+            with Base.batch():
+                for user in users:
+                    user.save()
+        """
+        if getattr(BATCH, 'touched', None) is not None:
+            # Nested batch: the outermost one flushes
+            yield
+            return
+        BATCH.touched = set()
+        try:
+            yield
+        finally:
+            touched, BATCH.touched = BATCH.touched, None
+            for klass in touched:
+                klass._flush()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        if cls.STORAGE is not None:
+            return cls.STORAGE.count(cls)
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
@@ -119,13 +444,62 @@ class Base():
         """ Return one object by ID
         """
         s_class = cls.__name__
-        return DATA[s_class].get(id)
+        obj = DATA[s_class].get(id)
+        if obj is None and cls.STORAGE is not None:
+            obj_json = cls.STORAGE.fetch(cls, id)
+            if obj_json is not None:
+                obj = cls._materialize(obj_json)
+        return obj
+
+    @classmethod
+    def page(cls, limit: int, cursor: str = None) -> tuple:
+        """ Return up to `limit` objects in a stable order (by ID),
+        starting after the object whose ID is `cursor`, and the cursor
+        of the next page, None if this one is the last
+        """
+        s_class = cls.__name__
+        if cls.STORAGE is not None:
+            objs = [cls._materialize(obj_json) for _, obj_json
+                    in cls.STORAGE.page(cls, limit + 1, cursor)]
+        else:
+            ids = ORDERED_IDS.get(s_class)
+            if ids is None:
+                with cls._locks()['data']:
+                    ids = ORDERED_IDS.get(s_class)
+                    if ids is None:
+                        ids = ORDERED_IDS[s_class] = sorted(DATA[s_class])
+            start = 0 if cursor is None else bisect_right(ids, cursor)
+            objs = []
+            for obj_id in ids[start:start + limit + 1]:
+                obj = DATA[s_class].get(obj_id)
+                if obj is not None:
+                    objs.append(obj)
+        if len(objs) > limit:
+            return objs[:limit], objs[limit - 1].id
+        return objs, None
+
+    @classmethod
+    def _materialize(cls, obj_json: dict) -> TypeVar('Base'):
+        """ Return the cached object for a stored one, building it on
+        first access
+        """
+        s_class = cls.__name__
+        obj = DATA[s_class].get(obj_json['id'])
+        if obj is None:
+            obj = cls(**obj_json)
+            with cls._locks()['data']:
+                obj = DATA[s_class].setdefault(obj.id, obj)
+        return obj
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        With a STORAGE backend, lookups go through the stored rows, so
+        indexed attributes must be saved before they can be searched.
         """
         s_class = cls.__name__
+
         def _search(obj):
             if len(attributes) == 0:
                 return True
@@ -133,5 +507,190 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        if cls.STORAGE is not None:
+            candidates = [cls._materialize(obj_json) for _, obj_json
+                          in cls.STORAGE.find(cls, attributes)]
+            return list(filter(_search, candidates))
+
+        # Narrow the candidates with the first indexed attribute, if any
+        candidates = DATA[s_class]
+        for k, v in attributes.items():
+            if k not in cls.INDEXED_ATTRIBUTES:
+                continue
+            try:
+                candidates = INDEXES[s_class][k].get(v, {})
+            except TypeError:
+                # Unhashable value: fall back to a full scan
+                continue
+            break
+
+        # list() copies the values atomically, writers may run meanwhile
+        return list(filter(_search, list(candidates.values())))
+
+    @classmethod
+    def _reset_indexes(cls):
+        """ Drop and recreate the empty indexes of the class
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.INDEXED_ATTRIBUTES}
+        INDEXED_VALUES[s_class] = {}
+        ORDERED_IDS[s_class] = None
+
+    @classmethod
+    def _index_add(cls, obj: TypeVar('Base')):
+        """ Index an object under its current attribute values
+        """
+        s_class = cls.__name__
+        ids = ORDERED_IDS.get(s_class)
+        if ids is not None:
+            i = bisect_left(ids, obj.id)
+            if i == len(ids) or ids[i] != obj.id:
+                insort(ids, obj.id)
+        if not cls.INDEXED_ATTRIBUTES:
+            return
+        cls._unindex_values(obj.id)
+        values = {}
+        for attr in cls.INDEXED_ATTRIBUTES:
+            value = getattr(obj, attr, None)
+            try:
+                # Buckets are replaced, not mutated, so readers can copy them
+                bucket = dict(INDEXES[s_class][attr].get(value, {}))
+            except TypeError:
+                continue
+            bucket[obj.id] = obj
+            INDEXES[s_class][attr][value] = bucket
+            values[attr] = value
+        INDEXED_VALUES[s_class][obj.id] = values
+
+    @classmethod
+    def _index_discard(cls, obj_id: str):
+        """ Remove an object from the indexes
+        """
+        s_class = cls.__name__
+        ids = ORDERED_IDS.get(s_class)
+        if ids is not None:
+            i = bisect_left(ids, obj_id)
+            if i < len(ids) and ids[i] == obj_id:
+                del ids[i]
+        cls._unindex_values(obj_id)
+
+    @classmethod
+    def _unindex_values(cls, obj_id: str):
+        """ Remove an object from the attribute indexes
+        """
+        s_class = cls.__name__
+        values = INDEXED_VALUES.get(s_class, {}).pop(obj_id, None)
+        if values is None:
+            return
+        for attr, value in values.items():
+            bucket = INDEXES[s_class][attr].get(value)
+            if bucket is None or obj_id not in bucket:
+                continue
+            bucket = dict(bucket)
+            del bucket[obj_id]
+            if bucket:
+                INDEXES[s_class][attr][value] = bucket
+            else:
+                del INDEXES[s_class][attr][value]
+
+
+class GroupCommit():
+    """ Background flusher that lets the saves and removes of many
+    threads share one file write (and one fsync in journal mode)
+
+    A flush happens `interval` seconds after the first queued mutation,
+    or as soon as `max_pending` mutations are queued. Callers block until
+    the flush holding their mutation is done, so save() keeps its
+    durability guarantee.
+    """
+
+    def __init__(self, interval: float = 0.01, max_pending: int = 256):
+        """ Initialize the flusher, which is not started yet
+        """
+        self.interval = interval
+        self.max_pending = max_pending
+        self.running = False
+        self._cond = threading.Condition()
+        self._classes = set()
+        self._count = 0
+        # Sequence numbers of the next flush and the last finished one
+        self._next = 1
+        self._done = 0
+        # Failed flushes: ticket -> [error, waiters yet to read it]
+        self._errors = {}
+        self._thread = None
+
+    def start(self) -> 'GroupCommit':
+        """ Start the flusher thread and route Base writes through it
+        """
+        global GROUP_COMMIT
+        with self._cond:
+            if self.running:
+                return self
+            self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        GROUP_COMMIT = self
+        return self
+
+    def stop(self):
+        """ Flush what is queued and stop the flusher thread
+        """
+        global GROUP_COMMIT
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if GROUP_COMMIT is self:
+            GROUP_COMMIT = None
+
+    def submit(self, cls: type):
+        """ Ask for the pending mutations of a class to be flushed and
+        wait until they are
+        """
+        with self._cond:
+            self._classes.add(cls)
+            self._count += 1
+            ticket = self._next
+            self._cond.notify_all()
+            while self._done < ticket:
+                self._cond.wait()
+            failed = self._errors.get(ticket)
+            if failed is None:
+                return
+            failed[1] -= 1
+            if failed[1] == 0:
+                del self._errors[ticket]
+        raise failed[0]
+
+    def _run(self):
+        """ Flusher loop
+        """
+        while True:
+            with self._cond:
+                while not self._classes and self.running:
+                    self._cond.wait()
+                if not self._classes:
+                    return
+                if self.running and self._count < self.max_pending:
+                    # Give concurrent writers a chance to join this flush
+                    self._cond.wait_for(
+                        lambda: self._count >= self.max_pending or
+                        not self.running, self.interval)
+                classes, self._classes = self._classes, set()
+                waiters, self._count = self._count, 0
+                ticket = self._next
+                self._next += 1
+            error = None
+            for cls in classes:
+                try:
+                    cls._flush()
+                except Exception as e:
+                    error = e
+            with self._cond:
+                if error is not None:
+                    self._errors[ticket] = [error, waiters]
+                self._done = ticket
+                self._cond.notify_all()
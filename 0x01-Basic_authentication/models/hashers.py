@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+""" Password hashers module
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Union
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+
+class Hasher(ABC):
+    """ Base password hasher
+
+    Encoded passwords are stored as `<name>$<parameters and hash>`, so
+    the hasher that made them is known when they are verified.
+    """
+    name = None
+
+    @abstractmethod
+    def encode(self, pwd: str) -> str:
+        """ Return the encoded hash of a password
+        """
+
+    @abstractmethod
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against an encoded hash of this hasher
+        """
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Whether an encoded hash uses outdated parameters
+        """
+        return False
+
+    @staticmethod
+    def _b64(data: bytes) -> str:
+        """ Unpadded base64 text of bytes
+        """
+        return base64.b64encode(data).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _unb64(text: str) -> bytes:
+        """ Bytes of an unpadded base64 text
+        """
+        return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class SHA256Hasher(Hasher):
+    """ Legacy unsalted SHA256 hex digest, stored without a prefix
+    """
+    name = 'sha256'
+
+    def encode(self, pwd: str) -> str:
+        """ Return the hex digest of a password
+        """
+        return hashlib.sha256(pwd.encode()).hexdigest().lower()
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against a hex digest
+        """
+        return hmac.compare_digest(self.encode(pwd), encoded)
+
+
+class PBKDF2Hasher(Hasher):
+    """ Salted PBKDF2-HMAC-SHA256,
+    `pbkdf2_sha256$<iterations>$<salt>$<hash>`
+    """
+    name = 'pbkdf2_sha256'
+    iterations = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000))
+
+    def _derive(self, pwd: str, salt: bytes, iterations: int) -> bytes:
+        """ Derive the key of a password
+        """
+        return hashlib.pbkdf2_hmac('sha256', pwd.encode(), salt, iterations)
+
+    def encode(self, pwd: str) -> str:
+        """ Return the encoded hash of a password
+        """
+        salt = os.urandom(16)
+        return "{}${}${}${}".format(
+            self.name, self.iterations, self._b64(salt),
+            self._b64(self._derive(pwd, salt, self.iterations)))
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against an encoded hash
+        """
+        _, iterations, salt, key = encoded.split('$')
+        return hmac.compare_digest(
+            self._derive(pwd, self._unb64(salt), int(iterations)),
+            self._unb64(key))
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Whether the hash was made with another iteration count
+        """
+        return int(encoded.split('$')[1]) != self.iterations
+
+
+class ScryptHasher(Hasher):
+    """ Salted scrypt, `scrypt$<n>$<r>$<p>$<salt>$<hash>`
+    """
+    name = 'scrypt'
+    n = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+    r = 8
+    p = 1
+
+    def _derive(self, pwd: str, salt: bytes, n: int, r: int,
+                p: int) -> bytes:
+        """ Derive the key of a password
+        """
+        return hashlib.scrypt(pwd.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def encode(self, pwd: str) -> str:
+        """ Return the encoded hash of a password
+        """
+        salt = os.urandom(16)
+        return "{}${}${}${}${}${}".format(
+            self.name, self.n, self.r, self.p, self._b64(salt),
+            self._b64(self._derive(pwd, salt, self.n, self.r, self.p)))
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against an encoded hash
+        """
+        _, n, r, p, salt, key = encoded.split('$')
+        return hmac.compare_digest(
+            self._derive(pwd, self._unb64(salt), int(n), int(r), int(p)),
+            self._unb64(key))
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Whether the hash was made with other cost parameters
+        """
+        n, r, p = encoded.split('$')[1:4]
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+
+class BCryptHasher(Hasher):
+    """ bcrypt, `bcrypt$<bcrypt hash>`, needs the bcrypt package
+    """
+    name = 'bcrypt'
+    rounds = int(os.getenv('PASSWORD_BCRYPT_ROUNDS', 12))
+
+    def __init__(self):
+        """ Import bcrypt
+        """
+        import bcrypt
+        self._bcrypt = bcrypt
+
+    def encode(self, pwd: str) -> str:
+        """ Return the encoded hash of a password
+        """
+        return "{}${}".format(self.name, self._bcrypt.hashpw(
+            pwd.encode(), self._bcrypt.gensalt(self.rounds)).decode())
+
+    def verify(self, pwd: str, encoded: str) -> bool:
+        """ Check a password against an encoded hash
+        """
+        return self._bcrypt.checkpw(
+            pwd.encode(), encoded.split('$', 1)[1].encode())
+
+    def needs_update(self, encoded: str) -> bool:
+        """ Whether the hash was made with another cost
+        """
+        return int(encoded.split('$')[3]) != self.rounds
+
+
+HASHERS = {}
+LEGACY_HASHER = SHA256Hasher()
+# Hasher of new passwords and of the lazy upgrade of older ones
+DEFAULT_HASHER = os.getenv('PASSWORD_HASHER', PBKDF2Hasher.name)
+
+# Successful verifications, keyed on a keyed digest of the hash and
+# password so that no plain password is kept in memory
+VERIFY_CACHE_SIZE = int(os.getenv('PASSWORD_VERIFY_CACHE_SIZE', 1024))
+VERIFY_CACHE = OrderedDict()
+VERIFY_CACHE_KEY = os.urandom(32)
+VERIFY_CACHE_LOCK = threading.Lock()
+
+
+def register_hasher(hasher: Hasher):
+    """ Make a hasher available by its name
+    """
+    HASHERS[hasher.name] = hasher
+
+
+for hasher_class in (PBKDF2Hasher, ScryptHasher, BCryptHasher):
+    try:
+        register_hasher(hasher_class())
+    except ImportError:
+        pass
+
+
+def identify_hasher(encoded: str) -> Union[Hasher, None]:
+    """ Return the hasher of an encoded password, or None if unknown
+    """
+    if '$' not in encoded:
+        return LEGACY_HASHER
+    return HASHERS.get(encoded.split('$', 1)[0])
+
+
+def make_password(pwd: str, algorithm: str = None) -> str:
+    """ Return the encoded hash of a password, made by the default hasher
+    unless another registered algorithm is given
+    """
+    return HASHERS[algorithm or DEFAULT_HASHER].encode(pwd)
+
+
+def check_password(pwd: str, encoded: str) -> bool:
+    """ Check a password against an encoded hash of any known hasher
+    """
+    hasher = identify_hasher(encoded)
+    if hasher is None:
+        return False
+    key = hmac.new(VERIFY_CACHE_KEY, "{}\0{}".format(encoded, pwd).encode(),
+                   hashlib.sha256).digest()
+    with VERIFY_CACHE_LOCK:
+        if key in VERIFY_CACHE:
+            VERIFY_CACHE.move_to_end(key)
+            return True
+    try:
+        valid = hasher.verify(pwd, encoded)
+    except ValueError:
+        return False
+    if valid and VERIFY_CACHE_SIZE > 0:
+        with VERIFY_CACHE_LOCK:
+            VERIFY_CACHE[key] = True
+            while len(VERIFY_CACHE) > VERIFY_CACHE_SIZE:
+                VERIFY_CACHE.popitem(last=False)
+    return valid
+
+
+def needs_upgrade(encoded: str) -> bool:
+    """ Whether an encoded password should be rehashed by the default
+    hasher, because it was made by another one or with older parameters
+    """
+    hasher = identify_hasher(encoded)
+    if hasher is None or hasher.name != DEFAULT_HASHER:
+        return True
+    return hasher.needs_update(encoded)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+""" Storage backends module
+"""
+from typing import Iterable, Tuple, Union
+from os import path
+import json
+import sqlite3
+import threading
+
+
+class SQLiteStorage():
+    """ SQLite storage backend for Base
+
+    Each class is kept in its own `.db_<Class>.sqlite` file, one row per
+    object holding its serialized form plus one indexed column for each
+    of the class INDEXED_ATTRIBUTES. Nothing is read at load time: rows
+    are materialized by Base when they are looked up, so startup does
+    not depend on the size of the dataset.
+
+    Mutations are staged in memory by Base.save()/remove() and written
+    in one transaction by flush(). Lookups overlay the staged mutations
+    on the rows, so they are visible before they reach the file.
+    """
+    FILE_FORMAT = ".db_{}.sqlite"
+    # Types that can be compared against an indexed SQL column
+    SQL_TYPES = (str, int, float, type(None))
+
+    def __init__(self):
+        """ Initialize the backend
+        """
+        self._lock = threading.Lock()
+        # Staged mutations: _staged[class][id] = serialized object or None
+        self._staged = {}
+        self._columns = {}
+        # Writes go through one connection per class, reads through one
+        # connection per thread so they never wait for a writer
+        self._writers = {}
+        self._readers = threading.local()
+
+    def _connect(self, s_class: str) -> sqlite3.Connection:
+        """ Open a connection to the file of a class
+        """
+        conn = sqlite3.connect(self.FILE_FORMAT.format(s_class),
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self, s_class: str) -> sqlite3.Connection:
+        """ Return the read connection of the current thread
+        """
+        conns = getattr(self._readers, 'conns', None)
+        if conns is None:
+            conns = self._readers.conns = {}
+        if s_class not in conns:
+            conns[s_class] = self._connect(s_class)
+        return conns[s_class]
+
+    def open(self, cls: type):
+        """ Create the table of a class if needed and forget any staged
+        mutation. An existing `.db_<Class>.json` snapshot is imported
+        the first time.
+        """
+        s_class = cls.__name__
+        columns = tuple(cls.INDEXED_ATTRIBUTES)
+        conn = self._writers.get(s_class)
+        if conn is None:
+            conn = self._writers[s_class] = self._connect(s_class)
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS objects "
+                "(id TEXT PRIMARY KEY, data TEXT NOT NULL{})".format(
+                    "".join(', "{}"'.format(c) for c in columns)))
+            for column in columns:
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS "ix_{0}" '
+                    'ON objects ("{0}")'.format(column))
+        with self._lock:
+            self._columns[s_class] = columns
+            self._staged[s_class] = {}
+
+        json_path = ".db_{}.json".format(s_class)
+        first = conn.execute("SELECT 1 FROM objects LIMIT 1").fetchone()
+        if first is None and path.exists(json_path):
+            with open(json_path, 'r') as f:
+                objs_json = json.load(f)
+            with self._lock:
+                self._staged[s_class].update(objs_json)
+            self.flush(cls)
+
+    def stage(self, cls: type, obj_id: str, obj_json: Union[dict, None]):
+        """ Stage the serialized object to write, or None to delete it
+        """
+        with self._lock:
+            self._staged[cls.__name__][obj_id] = obj_json
+
+    def flush(self, cls: type):
+        """ Write the staged mutations of a class in one transaction
+
+        Callers must serialize flushes of a class.
+        """
+        s_class = cls.__name__
+        with self._lock:
+            staged = dict(self._staged[s_class])
+            columns = self._columns[s_class]
+        if not staged:
+            return
+        rows = []
+        deleted = []
+        for obj_id, obj_json in staged.items():
+            if obj_json is None:
+                deleted.append((obj_id,))
+                continue
+            rows.append((obj_id, json.dumps(obj_json)) + tuple(
+                self._column_value(obj_json.get(c)) for c in columns))
+        conn = self._writers[s_class]
+        with conn:
+            if rows:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO objects VALUES ({})".format(
+                        ", ".join("?" * (2 + len(columns)))), rows)
+            if deleted:
+                conn.executemany(
+                    "DELETE FROM objects WHERE id = ?", deleted)
+        with self._lock:
+            current = self._staged[s_class]
+            for obj_id, obj_json in staged.items():
+                # Keep what was staged again while we were writing
+                if obj_id in current and current[obj_id] is obj_json:
+                    del current[obj_id]
+
+    def fetch(self, cls: type, obj_id: str) -> Union[dict, None]:
+        """ Return the serialized object with this ID, or None
+        """
+        s_class = cls.__name__
+        with self._lock:
+            if obj_id in self._staged[s_class]:
+                return self._staged[s_class][obj_id]
+        row = self._reader(s_class).execute(
+            "SELECT data FROM objects WHERE id = ?", (obj_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def find(self, cls: type,
+             attributes: dict) -> Iterable[Tuple[str, dict]]:
+        """ Return (id, serialized object) pairs that may match the
+        attributes, narrowed by the first indexed one. Callers still
+        have to check every attribute.
+        """
+        s_class = cls.__name__
+        column = None
+        for k, v in attributes.items():
+            if k in self._columns[s_class] and \
+                    isinstance(v, self.SQL_TYPES):
+                column, value = k, v
+                break
+        # Staged first: a flush committing meanwhile is still covered
+        with self._lock:
+            staged = dict(self._staged[s_class])
+        if column is None:
+            cursor = self._reader(s_class).execute(
+                "SELECT id, data FROM objects ORDER BY rowid")
+        else:
+            cursor = self._reader(s_class).execute(
+                'SELECT id, data FROM objects WHERE "{}" IS ? '
+                'ORDER BY rowid'.format(column),
+                (self._column_value(value),))
+        results = {}
+        for obj_id, data in cursor:
+            if obj_id not in staged:
+                results[obj_id] = json.loads(data)
+        for obj_id, obj_json in staged.items():
+            if obj_json is None:
+                continue
+            if column is None or obj_json.get(column) == value:
+                results[obj_id] = obj_json
+        return list(results.items())
+
+    def page(self, cls: type, limit: int,
+             after: str = None) -> Iterable[Tuple[str, dict]]:
+        """ Return up to `limit` (id, serialized object) pairs ordered by
+        ID, starting after the `after` ID
+        """
+        s_class = cls.__name__
+        with self._lock:
+            staged = dict(self._staged[s_class])
+        after = after or ""
+        # Rows deleted by staged mutations must be made up for
+        removed = sum(1 for obj_json in staged.values() if obj_json is None)
+        cursor = self._reader(s_class).execute(
+            "SELECT id, data FROM objects WHERE id > ? ORDER BY id LIMIT ?",
+            (after, limit + removed))
+        results = {}
+        for obj_id, data in cursor:
+            if obj_id not in staged:
+                results[obj_id] = json.loads(data)
+        for obj_id, obj_json in staged.items():
+            if obj_json is not None and obj_id > after:
+                results[obj_id] = obj_json
+        return [(obj_id, results[obj_id])
+                for obj_id in sorted(results)[:limit]]
+
+    def count(self, cls: type) -> int:
+        """ Return the number of stored objects of a class
+        """
+        s_class = cls.__name__
+        with self._lock:
+            staged = dict(self._staged[s_class])
+        conn = self._reader(s_class)
+        total = conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+        ids = list(staged.keys())
+        stored = 0
+        # Staged IDs already in the file are counted once, by their state
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            stored += conn.execute(
+                "SELECT COUNT(*) FROM objects WHERE id IN ({})".format(
+                    ", ".join("?" * len(chunk))), chunk).fetchone()[0]
+        alive = sum(1 for obj_json in staged.values() if obj_json is not None)
+        return total - stored + alive
+
+    @staticmethod
+    def _column_value(value):
+        """ Value stored in an indexed column
+        """
+        if isinstance(value, SQLiteStorage.SQL_TYPES):
+            return value
+        return json.dumps(value)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+""" Multi-threaded stress test of the models store
+
+Runs every storage mode in a scratch directory: threads save, update,
+remove and search users concurrently, then a fresh process reloads the
+store and checks that no update was lost.
+
+Usage: ./stress_models.py [threads] [operations per thread]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+# Environment of each storage mode
+MODES = {
+    'snapshot': {},
+    'journal': {'DB_JOURNAL_MODE': '1', 'DB_JOURNAL_COMPACT': '50'},
+    'group-commit': {'DB_JOURNAL_MODE': '1'},
+    'sqlite': {'DB_STORAGE': 'sqlite'},
+}
+EXPECTED_FILE = 'expected.json'
+
+
+def stress(mode: str, threads: int, operations: int) -> dict:
+    """ Mutates users from several threads and returns the final state
+    they expect, {id: [email, first_name]}
+    """
+    from models.base import GroupCommit
+    from models.user import User
+    User.load_from_file()
+    group_commit = None
+    if mode == 'group-commit':
+        group_commit = GroupCommit().start()
+
+    expected = {}
+    errors = []
+    lock = threading.Lock()
+
+    def work(worker: int):
+        mine = {}
+        for i in range(operations):
+            user = User(email='{}-{}@stress'.format(worker, i))
+            user.save()
+            mine[user.id] = user
+            if i % 2:
+                user.first_name = 'v{}'.format(i)
+                user.save()
+            if i % 4 == 3:
+                user.remove()
+                del mine[user.id]
+            found = User.search({'email': user.email})
+            if len(found) != (0 if i % 4 == 3 else 1):
+                errors.append('search of {} found {}'.format(
+                    user.email, len(found)))
+        with lock:
+            expected.update({obj_id: [user.email, user.first_name]
+                             for obj_id, user in mine.items()})
+
+    workers = [threading.Thread(target=work, args=(i,))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if group_commit is not None:
+        group_commit.stop()
+    if errors:
+        raise AssertionError('; '.join(errors[:5]))
+    return expected
+
+
+def check(expected: dict) -> list:
+    """ Reloads the store and returns the differences with `expected`
+    """
+    from models.user import User
+    User.load_from_file()
+    problems = []
+    if User.count() != len(expected):
+        problems.append('{} users stored, {} expected'.format(
+            User.count(), len(expected)))
+    for obj_id, (email, first_name) in expected.items():
+        user = User.get(obj_id)
+        if user is None:
+            problems.append('{} lost'.format(email))
+        elif [user.email, user.first_name] != [email, first_name]:
+            problems.append('{} stale: {}'.format(
+                email, [user.email, user.first_name]))
+    return problems
+
+
+def run_mode(mode: str, threads: int, operations: int) -> list:
+    """ Runs one mode in a scratch directory, returns its problems
+    """
+    env = dict(os.environ, **MODES[mode])
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                      env.get('PYTHONPATH')]))
+    with tempfile.TemporaryDirectory() as scratch:
+        for phase in (['--run', mode, str(threads), str(operations)],
+                      ['--check', mode]):
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__)] + phase,
+                cwd=scratch, env=env, capture_output=True, text=True)
+            if result.returncode != 0:
+                return [result.stderr.strip().splitlines()[-1]]
+            if result.stdout.strip():
+                return result.stdout.strip().splitlines()
+    return []
+
+
+def main():
+    """
+    Command line entry point
+    """
+    if sys.argv[1:2] == ['--run']:
+        mode, threads, operations = sys.argv[2], *map(int, sys.argv[3:5])
+        with open(EXPECTED_FILE, 'w') as f:
+            json.dump(stress(mode, threads, operations), f)
+        return
+    if sys.argv[1:2] == ['--check']:
+        with open(EXPECTED_FILE) as f:
+            for problem in check(json.load(f)):
+                print(problem)
+        return
+
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    failed = False
+    for mode in MODES:
+        problems = run_mode(mode, threads, operations)
+        print('{:<12} {}'.format(mode, 'FAIL' if problems else 'ok'))
+        for problem in problems[:10]:
+            print('  ' + problem)
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
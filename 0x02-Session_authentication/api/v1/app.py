@@ -3,6 +3,7 @@
 Route module for the API
 """
 
+from api.v1.auth.path_matcher import PathMatcher
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, g, request, Response
 from flask_cors import (CORS, cross_origin)
@@ -15,6 +16,13 @@ app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
 
+# Paths served without authentication, compiled once for require_auth
+EXCLUDED_PATHS = frozenset([
+    '/api/v1/status/', '/api/v1/unauthorized/',
+    '/api/v1/forbidden/', '/api/v1/auth_session/login/'
+])
+EXCLUDED_PATHS_MATCHER = PathMatcher(EXCLUDED_PATHS)
+
 auth_type = os.getenv('AUTH_TYPE')
 if auth_type:
     if auth_type == 'Auth':
@@ -23,10 +31,19 @@ if auth_type:
     elif auth_type == 'session_auth':
         from api.v1.auth.session_auth import SessionAuth
         auth = SessionAuth()
+    elif auth_type == 'session_token_auth':
+        from api.v1.auth.session_token_auth import SessionTokenAuth
+        auth = SessionTokenAuth()
     else:
         from api.v1.auth.basic_auth import BasicAuth
         auth = BasicAuth()
 
+group_commit_interval = os.getenv('DB_GROUP_COMMIT_INTERVAL')
+if group_commit_interval:
+    # Let concurrent requests share file writes of the models store
+    from models.base import GroupCommit
+    GroupCommit(interval=float(group_commit_interval)).start()
+
 
 @app.before_request
 def before_request() -> Union[str, None]:
@@ -36,17 +53,11 @@ def before_request() -> Union[str, None]:
     if auth is None:
         return None
 
-    excluded_paths = [
-        '/api/v1/status/', '/api/v1/unauthorized/',
-        '/api/v1/forbidden/', '/api/v1/auth_session/login/'
-    ]
-    if request.path not in excluded_paths:
+    if not auth.require_auth(request.path, EXCLUDED_PATHS_MATCHER,
+                             request.method):
         return None
-    if not auth.require_auth(request.path, excluded_paths):
-        return None
-    if auth.authorization_header(request) is None:
-        return abort(401)
-    if auth.session_cookie(request) is None:
+    if auth.authorization_header(request) is None and \
+            auth.session_cookie(request) is None:
         return abort(401)
     if auth.current_user(request) is None:
         return abort(403)
@@ -2,6 +2,7 @@
 """
 API authentication module
 """
+from api.v1.auth.path_matcher import PathMatcher
 import os
 from typing import List, TypeVar, Union
 
@@ -10,28 +11,31 @@ class Auth:
     """
     Manages the API authentication
     """
+    # PathMatcher compiled for each list given to require_auth
+    _matchers = {}
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher],
+                     method: str = None) -> bool:
         """
-        Returns a boolean
+        Returns False if the path (and method, if given) matches one of
+        the excluded paths, True otherwise
+
+        excluded_paths is ideally a PathMatcher compiled once at startup;
+        a plain list is compiled on first use and memoized.
         """
         if path is None or not excluded_paths:
             return True
 
-        path = path.rstrip('/') + '/'
+        if not isinstance(excluded_paths, PathMatcher):
+            key = tuple(excluded_paths)
+            matcher = self._matchers.get(key)
+            if matcher is None:
+                matcher = self._matchers[key] = PathMatcher(key)
+            excluded_paths = matcher
 
-        # Check if path is in excluded_paths
-        for excluded_path in excluded_paths:
-            if excluded_path.endswith('*'):
-                prefix = excluded_path[:-1]
-                if path.startswith(prefix):
-                    return False
-            elif path == excluded_path:
-                return False
-            # if path.startswith(excluded_path):
-            #     return False
-
-        return True
+        path = path.rstrip('/') + '/'
+        return not excluded_paths.match(path, method)
 
     def authorization_header(self, request: str = None) -> Union[str, None]:
         """ Takes a Flask request object and returns the Authorization
@@ -2,6 +2,12 @@
 """ Basic Authentication module """
 from api.v1.auth.auth import Auth
 import base64
+from collections import OrderedDict
+import hashlib
+import hmac
+import os
+import threading
+import time
 from typing import TypeVar, Union
 from models.user import User
 
@@ -9,11 +15,24 @@ from models.user import User
 class BasicAuth(Auth):
     """
     Basic authentication
+
+    Users authenticated from an Authorization header are cached for
+    CREDENTIALS_CACHE_TTL seconds, keyed on a keyed digest of the header,
+    so repeated requests skip the user search and the password hash. An
+    entry is only used while the user still exists with the same email
+    and stored password, which invalidates it on password change or
+    removal.
     """
+    CREDENTIALS_CACHE_TTL = int(os.getenv('BASIC_AUTH_CACHE_TTL', 60))
+    CREDENTIALS_CACHE_SIZE = int(os.getenv('BASIC_AUTH_CACHE_SIZE', 10000))
 
     def __init__(self):
         """Initializes BasicAuth class"""
         super().__init__()
+        # Random per-process key: raw headers are never kept in memory
+        self._cache_key = os.urandom(32)
+        self._cache_lock = threading.Lock()
+        self._credentials_cache = OrderedDict()
 
     def extract_base64_authorization_header(
             self, authorization_header:  str) -> Union[str, None]:
@@ -87,6 +106,47 @@ class BasicAuth(Auth):
                 return user
         return None
 
+    def _credentials_digest(self, authorization_header: str) -> bytes:
+        """
+        Returns the cache key of an Authorization header
+        """
+        return hmac.new(self._cache_key, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def _cached_user(self, digest: bytes) -> TypeVar('User'):
+        """
+        Returns the cached user of a header digest if still valid
+        """
+        with self._cache_lock:
+            entry = self._credentials_cache.get(digest)
+        if entry is None:
+            return None
+        user_id, email, password, expires_at = entry
+        user = User.get(user_id)
+        if (expires_at < time.time() or user is None or
+                user.email != email or user.password != password):
+            with self._cache_lock:
+                self._credentials_cache.pop(digest, None)
+            return None
+        with self._cache_lock:
+            if digest in self._credentials_cache:
+                self._credentials_cache.move_to_end(digest)
+        return user
+
+    def _cache_user(self, digest: bytes, user: TypeVar('User')) -> None:
+        """
+        Caches the user authenticated by a header digest
+        """
+        if self.CREDENTIALS_CACHE_TTL <= 0:
+            return
+        entry = (user.id, user.email, user.password,
+                 time.time() + self.CREDENTIALS_CACHE_TTL)
+        with self._cache_lock:
+            self._credentials_cache[digest] = entry
+            self._credentials_cache.move_to_end(digest)
+            while len(self._credentials_cache) > self.CREDENTIALS_CACHE_SIZE:
+                self._credentials_cache.popitem(last=False)
+
     def current_user(self, request=None) -> TypeVar('User'):
         """
         Retrieves a User instance for a request
@@ -97,6 +157,11 @@ class BasicAuth(Auth):
         if auth_header is None:
             return None
 
+        digest = self._credentials_digest(auth_header)
+        user = self._cached_user(digest)
+        if user is not None:
+            return user
+
         credentials = self.extract_base64_authorization_header(
             auth_header)
         if credentials is None:
@@ -112,4 +177,7 @@ class BasicAuth(Auth):
         if user_email is None or user_pwd is None:
             return None
 
-        return self.user_object_from_credentials(user_email, user_pwd)
+        user = self.user_object_from_credentials(user_email, user_pwd)
+        if user is not None:
+            self._cache_user(digest, user)
+        return user
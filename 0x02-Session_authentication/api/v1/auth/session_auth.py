@@ -2,15 +2,34 @@
 """ Creating a session auth module """
 
 from .auth import Auth
+from .session_store import session_store_from_env
 from models.user import User
+import threading
 import uuid
 
 
 class SessionAuth(Auth):
     """
     Session-based authentication mechanism
+
+    Sessions live in the store selected by the SESSION_STORE environment
+    variable, see session_store_from_env(). It is shared by every
+    instance and built on first use.
     """
-    user_id_by_session_id = {}
+    user_id_by_session_id = None
+    _store_lock = threading.Lock()
+
+    @classmethod
+    def session_store(cls):
+        """
+        Returns the session store, building it on first use
+        """
+        if SessionAuth.user_id_by_session_id is None:
+            with SessionAuth._store_lock:
+                if SessionAuth.user_id_by_session_id is None:
+                    SessionAuth.user_id_by_session_id = \
+                        session_store_from_env()
+        return SessionAuth.user_id_by_session_id
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -19,7 +38,7 @@ class SessionAuth(Auth):
         if user_id is None or not isinstance(user_id, str):
             return None
         session_id = str(uuid.uuid4())
-        self.user_id_by_session_id[session_id] = user_id
+        self.session_store().set(session_id, user_id)
         return session_id
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
@@ -28,7 +47,7 @@ class SessionAuth(Auth):
         """
         if session_id is None or not isinstance(session_id, str):
             return None
-        return self.user_id_by_session_id.get(session_id)
+        return self.session_store().get(session_id)
 
     def current_user(self, request=None) -> User:
         """
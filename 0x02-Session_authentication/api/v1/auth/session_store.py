@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+""" Session stores module """
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Union
+import os
+import sqlite3
+import threading
+import time
+
+
+class SessionStore(ABC):
+    """
+    Maps session IDs to user IDs with TTL expiry and a bounded size
+
+    A `ttl` of 0 or less means sessions never expire. Expired sessions
+    are dropped lazily on lookup and by sweep(), which a daemon thread
+    started with start_sweeper() calls periodically when needs_sweeper()
+    says there is work for it.
+    """
+
+    def __init__(self, ttl: int = 0, max_size: int = 100000):
+        """ Initializes the store """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sweeper = None
+
+    def _expires_at(self) -> float:
+        """ Returns the expiry time of a session created now """
+        return time.time() + self.ttl if self.ttl > 0 else 0
+
+    @abstractmethod
+    def set(self, session_id: str, user_id: str) -> None:
+        """ Stores the user ID of a session """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Union[str, None]:
+        """ Returns the user ID of a live session, or None """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """ Removes a session """
+
+    def sweep(self) -> int:
+        """ Removes expired sessions and returns how many were removed """
+        return 0
+
+    def needs_sweeper(self) -> bool:
+        """ Whether sweep() has anything to do """
+        return self.ttl > 0
+
+    def start_sweeper(self, interval: float = 60) -> None:
+        """ Sweeps expired sessions every `interval` seconds on a daemon
+        thread
+        """
+        if self._sweeper is not None:
+            return
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=_run, daemon=True)
+        self._sweeper.start()
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process session store, least recently used sessions are evicted
+    once max_size is reached
+    """
+
+    def __init__(self, ttl: int = 0, max_size: int = 100000):
+        """ Initializes the store """
+        super().__init__(ttl, max_size)
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def set(self, session_id: str, user_id: str) -> None:
+        """ Stores the user ID of a session """
+        with self._lock:
+            self._sessions[session_id] = (user_id, self._expires_at())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Union[str, None]:
+        """ Returns the user ID of a live session, or None """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at and expires_at < time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return user_id
+
+    def delete(self, session_id: str) -> None:
+        """ Removes a session """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sweep(self) -> int:
+        """ Removes expired sessions and returns how many were removed """
+        if self.ttl <= 0:
+            return 0
+        now = time.time()
+        with self._lock:
+            expired = [session_id for session_id, (_, expires_at)
+                       in self._sessions.items()
+                       if expires_at and expires_at < now]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session store in a local SQLite file, shared by every worker
+    process of the host
+
+    Last access times are refreshed at most every ACCESS_RESOLUTION
+    seconds, and sessions beyond max_size are evicted by sweep(), to
+    keep lookups from writing on every request.
+    """
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, path: str = '.db_sessions.sqlite', ttl: int = 0,
+                 max_size: int = 100000):
+        """ Initializes the store """
+        super().__init__(ttl, max_size)
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires "
+                         "ON sessions (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_access "
+                         "ON sessions (last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """ Returns the connection of the current thread """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def set(self, session_id: str, user_id: str) -> None:
+        """ Stores the user ID of a session """
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                         (session_id, user_id, self._expires_at(), now))
+
+    def get(self, session_id: str) -> Union[str, None]:
+        """ Returns the user ID of a live session, or None """
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT user_id, expires_at, last_access FROM sessions "
+                "WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            user_id, expires_at, last_access = row
+            if expires_at and expires_at < now:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?",
+                             (session_id,))
+                return None
+            if now - last_access > self.ACCESS_RESOLUTION:
+                conn.execute("UPDATE sessions SET last_access = ? "
+                             "WHERE session_id = ?", (now, session_id))
+            return user_id
+
+    def delete(self, session_id: str) -> None:
+        """ Removes a session """
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?",
+                         (session_id,))
+
+    def needs_sweeper(self) -> bool:
+        """ Always true, sweep() also enforces max_size """
+        return True
+
+    def sweep(self) -> int:
+        """ Removes expired sessions, then the least recently used ones
+        beyond max_size, and returns how many were removed
+        """
+        with self._conn() as conn:
+            removed = conn.execute(
+                "DELETE FROM sessions WHERE expires_at > 0 "
+                "AND expires_at < ?", (time.time(),)).rowcount
+            removed += conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY last_access DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_size,)).rowcount
+            return removed
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Session store on a Redis-protocol server, shared by every worker
+
+    Expiry is delegated to the server key TTL, so sweep() has nothing to
+    do. The size bound is the server's: run it with a `maxmemory` limit
+    and the `allkeys-lru` eviction policy.
+    """
+    PREFIX = 'session:'
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', ttl: int = 0,
+                 max_size: int = 100000):
+        """ Initializes the store """
+        super().__init__(ttl, max_size)
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RedisSessionStore requires the redis package")
+        self._redis = redis.Redis.from_url(url)
+
+    def set(self, session_id: str, user_id: str) -> None:
+        """ Stores the user ID of a session """
+        self._redis.set(self.PREFIX + session_id, user_id,
+                        ex=self.ttl if self.ttl > 0 else None)
+
+    def get(self, session_id: str) -> Union[str, None]:
+        """ Returns the user ID of a live session, or None """
+        user_id = self._redis.get(self.PREFIX + session_id)
+        return None if user_id is None else user_id.decode('utf-8')
+
+    def delete(self, session_id: str) -> None:
+        """ Removes a session """
+        self._redis.delete(self.PREFIX + session_id)
+
+    def needs_sweeper(self) -> bool:
+        """ Never, the server expires and evicts keys itself """
+        return False
+
+
+def session_store_from_env() -> SessionStore:
+    """
+    Returns the session store configured by the environment:
+      - SESSION_STORE: memory (default), sqlite or redis
+      - SESSION_DURATION: session TTL in seconds, 0 for no expiry
+      - SESSION_STORE_SIZE: maximum number of sessions kept
+      - SESSION_STORE_PATH: SQLite file of the sqlite store
+      - SESSION_REDIS_URL: server URL of the redis store
+    """
+    kind = os.getenv('SESSION_STORE', 'memory')
+    try:
+        ttl = int(os.getenv('SESSION_DURATION', 0))
+    except ValueError:
+        ttl = 0
+    max_size = int(os.getenv('SESSION_STORE_SIZE', 100000))
+    if kind == 'sqlite':
+        store = SQLiteSessionStore(
+            os.getenv('SESSION_STORE_PATH', '.db_sessions.sqlite'),
+            ttl, max_size)
+    elif kind == 'redis':
+        store = RedisSessionStore(
+            os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'),
+            ttl, max_size)
+    else:
+        store = MemorySessionStore(ttl, max_size)
+    if store.needs_sweeper():
+        store.start_sweeper()
+    return store
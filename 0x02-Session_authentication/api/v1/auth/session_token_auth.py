@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+""" Stateless session auth module """
+
+from .session_auth import SessionAuth
+from .session_tokens import token_signer_from_env
+
+
+class SessionTokenAuth(SessionAuth):
+    """
+    Session authentication with signed session tokens
+
+    The session cookie is a token carrying the user ID, signed and
+    expiring, see TokenSigner. Resolving it needs no session store, so
+    any worker can serve any session. Logging out revokes the token.
+    """
+
+    def __init__(self):
+        """ Initializes the token signer """
+        super().__init__()
+        self.signer = token_signer_from_env()
+
+    def create_session(self, user_id: str = None) -> str:
+        """
+        Creates a session token for a user_id
+        """
+        if user_id is None or not isinstance(user_id, str):
+            return None
+        return self.signer.issue(user_id)
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """
+        Returns the user ID of a valid session token
+        """
+        if session_id is None or not isinstance(session_id, str):
+            return None
+        claims = self.signer.verify(session_id)
+        if claims is None:
+            return None
+        return claims.get('sub')
+
+    def destroy_session(self, request=None) -> bool:
+        """
+        Revokes the session token of a request
+        """
+        if request is None:
+            return False
+        session_cookie = self.session_cookie(request)
+        if session_cookie is None:
+            return False
+        return self.signer.revoke(session_cookie)
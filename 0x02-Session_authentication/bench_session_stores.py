@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" Throughput benchmark of the session stores
+
+Creates sessions and then looks them up from several threads, in each
+session store, and prints operations per second. The redis store is only
+run when SESSION_REDIS_URL is set and the redis package is installed.
+
+Usage: ./bench_session_stores.py [threads] [sessions per thread]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from api.v1.auth.session_store import (MemorySessionStore,
+                                       RedisSessionStore,
+                                       SessionStore, SQLiteSessionStore)
+
+
+def run_threads(threads: int, target) -> float:
+    """ Runs target(worker) on `threads` threads, returns the elapsed
+    seconds
+    """
+    workers = [threading.Thread(target=target, args=(i,))
+               for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def bench(store: SessionStore, threads: int, sessions: int) -> tuple:
+    """ Returns the create and lookup rates of a store, in ops/sec
+    """
+    ids = [[str(uuid.uuid4()) for _ in range(sessions)]
+           for _ in range(threads)]
+
+    def create(worker: int):
+        for session_id in ids[worker]:
+            store.set(session_id, 'user-{}'.format(worker))
+
+    def lookup(worker: int):
+        for session_id in ids[worker]:
+            assert store.get(session_id) == 'user-{}'.format(worker)
+
+    total = threads * sessions
+    return (total / run_threads(threads, create),
+            total / run_threads(threads, lookup))
+
+
+def main():
+    """
+    Command line entry point
+    """
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    size = threads * sessions
+    print('{:<8} {:>12} {:>12}'.format('store', 'create/s', 'lookup/s'))
+    with tempfile.TemporaryDirectory() as scratch:
+        stores = [
+            ('memory', MemorySessionStore(3600, size)),
+            ('sqlite', SQLiteSessionStore(
+                os.path.join(scratch, 'sessions.sqlite'), 3600, size)),
+        ]
+        if os.getenv('SESSION_REDIS_URL'):
+            try:
+                stores.append(('redis', RedisSessionStore(
+                    os.getenv('SESSION_REDIS_URL'), 3600, size)))
+            except RuntimeError as e:
+                print('redis skipped: {}'.format(e))
+        for name, store in stores:
+            print('{:<8} {:>12,.0f} {:>12,.0f}'.format(
+                name, *bench(store, threads, sessions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,12 @@ app = Flask(__name__)
 AUTH = Auth()
 
 
+@app.teardown_appcontext
+def teardown_db(exception=None) -> None:
+    """ Releases the database session of the request """
+    AUTH.teardown()
+
+
 @app.route('/', methods=['GET'], strict_slashes=False)
 def index() -> tuple[Response, int]:
     """ A simple flask method """
@@ -56,7 +62,7 @@ def logout() -> Response:
     session_id = request.cookies.get('session_id')
     user = AUTH.get_user_from_session_id(session_id)
     if user:
-        AUTH.destroy_session(user.id)
+        AUTH.destroy_session(user.id, session_id)
         return redirect('/')
     else:
         return jsonify({'error': 'Forbidden'}), 403
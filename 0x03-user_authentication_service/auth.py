@@ -2,23 +2,132 @@
 """ Auth class module """
 
 import bcrypt
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+from itertools import islice
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Iterable
 import uuid
 from db import DB
+from session_cache import UserSnapshot, session_cache_from_env
+from session_tokens import token_signer_from_env
 from user import User
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 
+# Bounds the bcrypt calls running at once (BCRYPT_CONCURRENCY, the CPU
+# count by default) so a login storm cannot take every core and worker
+BCRYPT_SLOTS = threading.BoundedSemaphore(
+    int(os.getenv('BCRYPT_CONCURRENCY', 0)) or os.cpu_count() or 1)
 
-def _hash_password(password: str) -> bytes:
+# bcrypt.gensalt() default cost
+DEFAULT_ROUNDS = 12
+
+# Sessions expire SESSION_DURATION seconds after their last use (0 for
+# never), which is recorded at most every SESSION_RENEW_INTERVAL seconds.
+# Expired sessions are deleted every SESSION_REAP_INTERVAL seconds.
+SESSION_DURATION = int(os.getenv('SESSION_DURATION', 86400))
+SESSION_RENEW_INTERVAL = int(os.getenv('SESSION_RENEW_INTERVAL', 60))
+SESSION_REAP_INTERVAL = int(os.getenv('SESSION_REAP_INTERVAL', 300))
+
+
+def calibrate_cost(target_ms: float, samples: int = 5) -> int:
+    """Returns the highest bcrypt cost hashing within target_ms on this
+    host, each extra round doubling the work
+
+    Each cost is timed `samples` times and judged on the median, so one
+    noisy run does not move the result.
+
+    Args:
+        target_ms (float): hashing latency to aim for, in milliseconds
+        samples (int): timings taken per cost
+    """
+    rounds = 4
+    while rounds < 31:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.hashpw(b'calibration', bcrypt.gensalt(rounds))
+            timings.append((time.perf_counter() - start) * 1000)
+        if statistics.median(timings) * 2 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+@lru_cache(maxsize=None)
+def _calibrated_cost(target_ms: float) -> int:
+    """Calibrates once per target latency
+    """
+    return calibrate_cost(target_ms)
+
+
+def _target_rounds() -> int:
+    """Returns the bcrypt cost of new hashes: BCRYPT_ROUNDS if set, else
+    the cost calibrated for BCRYPT_TARGET_MS if set, else the default
+
+    BCRYPT_TARGET_MS calibrates in every process, so workers can settle
+    on different costs. Pin one cost for the whole deployment with
+    BCRYPT_ROUNDS, as printed by `./auth.py <target_ms>`.
+    """
+    rounds = os.getenv('BCRYPT_ROUNDS')
+    if rounds:
+        return int(rounds)
+    target_ms = os.getenv('BCRYPT_TARGET_MS')
+    if target_ms:
+        return _calibrated_cost(float(target_ms))
+    return DEFAULT_ROUNDS
+
+
+def _hash_cost(hashed_password: str) -> int:
+    """Returns the cost factor of a bcrypt hash, `$2b$<cost>$...`
+    """
+    return int(hashed_password.split('$')[2])
+
+
+def _hash_password(password: str, rounds: int = None) -> bytes:
     """Takes in a string password and returns a byte-hashed salt
 
     Args:
         password (str): input password to be hashed
+        rounds (int): bcrypt cost, _target_rounds() by default
     """
-    salt = bcrypt.gensalt()
-    hash_pwd = bcrypt.hashpw(password.encode('utf-8'), salt)
+    salt = bcrypt.gensalt(rounds or _target_rounds())
+    with BCRYPT_SLOTS:
+        hash_pwd = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hash_pwd
 
 
+def _check_password(password: str, hashed_password: str) -> bool:
+    """Checks a password against its bcrypt hash
+
+    Args:
+        password (str): password to check
+        hashed_password (str): stored bcrypt hash
+    """
+    with BCRYPT_SLOTS:
+        return bcrypt.checkpw(password.encode('utf-8'),
+                              hashed_password.encode('utf-8'))
+
+
+def _utc(timestamp: float) -> datetime:
+    """Returns the naive UTC datetime stored for a timestamp
+    """
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(
+        tzinfo=None)
+
+
+def _timestamp(value: datetime) -> float:
+    """Returns the timestamp of a stored naive UTC datetime
+    """
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
 def _generate_uuid() -> str:
     """Returns a string representation of a new UUID
     """
@@ -33,65 +142,225 @@ class Auth:
         """Initializes the Auth module
         """
         self._db = DB()
+        self._sessions = session_cache_from_env()
+        self._db.on_update(
+            lambda user_id, session_id: self._forget_sessions(user_id))
+        self._reaper = None
+        # SESSION_MODE=token: sessions are signed tokens, see TokenSigner
+        self._tokens = None
+        if os.getenv('SESSION_MODE') == 'token':
+            self._tokens = token_signer_from_env()
+        elif SESSION_DURATION > 0 and SESSION_REAP_INTERVAL > 0:
+            self.start_reaper(SESSION_REAP_INTERVAL)
 
     def register_user(self, email: str, password: str) -> User:
         """Registers a new user into the database
+
+        The unique index on email rejects duplicates in the INSERT itself,
+        without a lookup beforehand.
         """
-        try:
-            if self._db.find_user_by(email=email) is not None:
-                raise ValueError(f'User {email} already exists')
-        except NoResultFound:
-            pass
         hashed_pwd = _hash_password(password).decode('utf-8')
-        return self._db.add_user(email=email, hashed_password=hashed_pwd)
+        try:
+            return self._db.add_user(email=email, hashed_password=hashed_pwd)
+        except IntegrityError:
+            raise ValueError(f'User {email} already exists')
+
+    def register_users(self, users: Iterable[dict], batch_size: int = 1000,
+                       workers: int = None, upsert: bool = False,
+                       progress: Callable[[int, float], None] = None) -> int:
+        """Registers users in bulk
+
+        Rows with a `hashed_password` are stored as they are, the
+        `password` of the others is hashed on a process pool. Rows are
+        consumed lazily, one batch at a time, so any stream works.
+
+        Args:
+            users (Iterable[dict]): dicts with an `email` and either a
+                `password` or a bcrypt `hashed_password`
+            batch_size (int): number of rows hashed and inserted at once
+            workers (int): hashing processes, the CPU count by default
+            upsert (bool): replace the password of existing emails
+                instead of skipping them
+            progress: called after each batch with the number of rows
+                processed so far and the rows per second
+
+        Returns:
+            int: the number of rows processed
+        """
+        workers = workers or os.cpu_count() or 1
+        hasher = partial(_hash_password, rounds=_target_rounds())
+        users = iter(users)
+        count = 0
+        started = time.time()
+        with ProcessPoolExecutor(workers) as executor:
+            while True:
+                batch = list(islice(users, batch_size))
+                if not batch:
+                    break
+                plain = [user['password'] for user in batch
+                         if not user.get('hashed_password')]
+                hashes = executor.map(
+                    hasher, plain,
+                    chunksize=max(1, len(plain) // (workers * 4)))
+                rows = []
+                for user in batch:
+                    hashed_pwd = user.get('hashed_password')
+                    if not hashed_pwd:
+                        hashed_pwd = next(hashes).decode('utf-8')
+                    rows.append({'email': user['email'],
+                                 'hashed_password': hashed_pwd})
+                count += self._db.add_users(rows, batch_size, upsert)
+                if progress is not None:
+                    elapsed = time.time() - started
+                    progress(count, count / elapsed if elapsed else 0)
+        return count
 
     def valid_login(self, email: str, password: str) -> bool:
         """Validates a registered user
+
+        A password hashed with a lower cost than the current target is
+        rehashed and stored, so the cost can rise without a migration.
         """
         try:
             user = self._db.find_user_by(email=email)
-            if user is not None:
-                return bcrypt.checkpw(
-                    password.encode('utf-8'),
-                    user.hashed_password.encode('utf-8'))
-            else:
+            if user is None:
+                return False
+            if not _check_password(password, user.hashed_password):
                 return False
         except Exception:
             return False
+        rounds = _target_rounds()
+        # Only upgrades: workers disagreeing on the target cannot make
+        # the password flip back and forth between two costs
+        if _hash_cost(user.hashed_password) < rounds:
+            try:
+                self._db.update_user(
+                    user.id, hashed_password=_hash_password(
+                        password, rounds).decode('utf-8'))
+            except Exception:
+                # The login stays valid, the rehash is retried next time
+                pass
+        return True
 
     def create_session(self, email: str) -> str:
-        """Finds a user with `email` and generates a session ID
+        """Finds a user with `email` and generates a session ID, one more
+        session of the user
         """
         try:
             user = self._db.find_user_by(email=email)
             if user is not None:
+                if self._tokens is not None:
+                    return self._tokens.issue(user.id, email=user.email)
                 session_id = _generate_uuid()
-                user.session_id = session_id
+                self._db.add_session(user.id, session_id, _utc(time.time()))
                 return session_id
             return None
         except Exception:
             return None
 
-    def get_user_from_session_id(self, session_id: str) -> str:
-        """Returns the corresponding user from session_id or None
+    def teardown(self) -> None:
+        """Releases the database session of the current thread
+        """
+        self._db.remove_session()
+
+    def get_user_from_session_id(self, session_id: str) -> UserSnapshot:
+        """Returns a snapshot of the corresponding user from session_id or
+        None if the session does not exist or expired
+
+        Snapshots are cached, so repeated lookups of a session skip the
+        database. Using a session renews it, writing its last use at most
+        every SESSION_RENEW_INTERVAL seconds.
+
+        In token mode the snapshot is read from the token itself, without
+        any lookup.
         """
         if session_id is None:
             return None
-        try:
-            user = self._db.find_user_by(session_id=session_id)
-            return user
-        except NoResultFound:
+        if self._tokens is not None:
+            claims = self._tokens.verify(session_id)
+            if claims is None:
+                return None
+            return UserSnapshot(claims['sub'], claims.get('email'),
+                                session_id, claims['exp'] - self._tokens.ttl)
+        now = time.time()
+        generation = self._sessions.generation
+        user = self._sessions.get(session_id)
+        cache = user is None
+        if user is None:
+            try:
+                session, found = self._db.find_session(session_id)
+            except NoResultFound:
+                return None
+            user = UserSnapshot(found.id, found.email, session.id,
+                                _timestamp(session.last_seen))
+        if SESSION_DURATION > 0 and \
+                user.last_seen + SESSION_DURATION <= now:
+            # Left for the reaper to delete
+            self._sessions.invalidate(session_id)
             return None
+        if now - user.last_seen >= SESSION_RENEW_INTERVAL:
+            if not self._db.touch_session(session_id, _utc(now)):
+                # Destroyed or reaped through another worker
+                self._sessions.invalidate(session_id)
+                return None
+            user = user._replace(last_seen=now)
+            cache = True
+        if cache:
+            self._sessions.put(
+                user, generation, user.last_seen + SESSION_DURATION
+                if SESSION_DURATION > 0 else None)
+        return user
 
-    def destroy_session(self, user_id: int) -> None:
-        """Updates the corresponding user's ID to None
+    def destroy_session(self, user_id: int, session_id: str = None) -> None:
+        """Removes a session of the user, or all of them if session_id is
+        None. In token mode only the given token can be revoked.
         """
-        user = self._db.find_user_by(id=user_id)
-        if user is not None:
-            user_id = None
-            self._db.update_user(user_id, {'session_id': None})
+        if self._tokens is not None:
+            if session_id is not None:
+                self._tokens.revoke(session_id)
+            return
+        if session_id is None:
+            session_ids = self._db.session_ids(user_id)
         else:
-            return None
+            session_ids = [session_id]
+        self._db.delete_sessions(user_id, session_id)
+        for removed in session_ids:
+            self._sessions.invalidate(removed)
+
+    def _forget_sessions(self, user_id: int) -> None:
+        """Drops the cached sessions of a user whose record changed
+        """
+        for session_id in self._db.session_ids(user_id):
+            self._sessions.invalidate(session_id)
+
+    def reap_sessions(self) -> int:
+        """Deletes the expired sessions and returns how many were deleted
+        """
+        if SESSION_DURATION <= 0:
+            return 0
+        return self._db.delete_stale_sessions(
+            _utc(time.time() - SESSION_DURATION))
+
+    def start_reaper(self, interval: float) -> None:
+        """Reaps expired sessions every `interval` seconds on a daemon
+        thread
+        """
+        if self._reaper is not None:
+            return
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap_sessions()
+                except SQLAlchemyError:
+                    # Tried again on the next round
+                    pass
+                finally:
+                    self._db.remove_session()
+
+        self._reaper = threading.Thread(target=_run, daemon=True)
+        self._reaper.start()
 
     def get_reset_password_token(self, email: str) -> str:
         """Generates a password reset token for the user
@@ -107,3 +376,9 @@ class Auth:
         self._db.update_user(user.id, reset_token=reset_token)
 
         return reset_token
+
+
+if __name__ == "__main__":
+    # Prints the cost to pin in BCRYPT_ROUNDS for a target latency
+    print('BCRYPT_ROUNDS={}'.format(calibrate_cost(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 250)))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Concurrent login throughput benchmark of Auth.valid_login
+
+Bulk-loads users into a scratch SQLite database, then logs them in from
+many threads, as the request threads of the Flask server would, with
+several sizes of the BCRYPT_SLOTS semaphore bounding the bcrypt calls.
+Prints the logins per second and the median and 99th percentile login
+latency of each size.
+
+Usage: ./bench_logins.py [threads] [logins per thread]
+"""
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+SCRATCH = tempfile.mkdtemp()
+os.environ.setdefault('USER_DB_URL', 'sqlite:///{}'.format(
+    os.path.join(SCRATCH, 'bench.db')))
+os.environ.setdefault('USER_DB_ECHO', '0')
+os.environ.setdefault('BCRYPT_ROUNDS', '10')
+
+import auth  # noqa: E402
+
+USERS = 100
+
+
+def run(service: auth.Auth, threads: int, logins: int) -> tuple:
+    """ Returns the logins/sec, median and p99 latency in ms """
+    latencies = []
+    lock = threading.Lock()
+
+    def work(worker: int):
+        mine = []
+        for i in range(logins):
+            email = 'user{}@bench'.format((worker * logins + i) % USERS)
+            start = time.perf_counter()
+            assert service.valid_login(email, 'password')
+            mine.append(time.perf_counter() - start)
+        service.teardown()
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=work, args=(i,))
+               for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (len(latencies) / elapsed,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99) - 1] * 1000)
+
+
+def main():
+    """
+    Command line entry point
+    """
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    logins = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    service = auth.Auth()
+    hashed = auth._hash_password('password').decode('utf-8')
+    service._db.add_users({'email': 'user{}@bench'.format(i),
+                           'hashed_password': hashed}
+                          for i in range(USERS))
+    print('{:<6} {:>10} {:>10} {:>10}'.format('slots', 'logins/s',
+                                              'p50 ms', 'p99 ms'))
+    cpus = os.cpu_count() or 1
+    try:
+        for slots in sorted({1, cpus, 2 * cpus, threads}):
+            auth.BCRYPT_SLOTS = threading.BoundedSemaphore(slots)
+            print('{:<6} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                slots, *run(service, threads, logins)))
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+""" Profile lookup benchmark of the DB at scale
+
+Bulk-loads users with DB.add_users() and one session each into a
+scratch SQLite database, then times the lookups behind login and
+GET /profile, find_user_by(email=...) and find_session(), against an
+unindexed find_user_by(hashed_password=...) that scans the table.
+
+Usage: ./bench_lookups.py [rows]
+"""
+from datetime import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+SCRATCH = tempfile.mkdtemp()
+os.environ.setdefault('USER_DB_URL', 'sqlite:///{}'.format(
+    os.path.join(SCRATCH, 'bench.db')))
+os.environ.setdefault('USER_DB_ECHO', '0')
+
+from sqlalchemy import insert  # noqa: E402
+from db import DB  # noqa: E402
+from user import UserSession  # noqa: E402
+
+LOOKUPS = 1000
+# Scans are slow on large tables, fewer of them are timed
+SCANS = 5
+BATCH_SIZE = 10000
+
+
+def load(db: DB, rows: int) -> None:
+    """ Adds `rows` users, user N having the session UUID N """
+    db.add_users(({'email': 'user{}@bench'.format(i),
+                   'hashed_password': 'hash{}'.format(i)}
+                  for i in range(1, rows + 1)), batch_size=BATCH_SIZE)
+    now = datetime.utcnow()
+    with db._engine.begin() as conn:
+        for start in range(1, rows + 1, BATCH_SIZE):
+            conn.execute(insert(UserSession), [
+                {'id': str(uuid.UUID(int=i)), 'user_id': i,
+                 'created_at': now, 'last_seen': now}
+                for i in range(start, min(start + BATCH_SIZE, rows + 1))])
+
+
+def per_lookup(func, keys: list) -> float:
+    """ Returns the mean time of func(key), in us """
+    start = time.perf_counter()
+    for key in keys:
+        func(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def main():
+    """
+    Command line entry point
+    """
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    try:
+        db = DB()
+        start = time.perf_counter()
+        load(db, rows)
+        print('loaded {:,} users and sessions in {:.1f}s'.format(
+            rows, time.perf_counter() - start))
+        rng = random.Random(rows)
+        keys = [rng.randint(1, rows) for _ in range(LOOKUPS)]
+        results = [
+            ('find_user_by(email)', per_lookup(
+                lambda i: db.find_user_by(email='user{}@bench'.format(i)),
+                keys)),
+            ('find_session', per_lookup(
+                lambda i: db.find_session(str(uuid.UUID(int=i))), keys)),
+            ('find_user_by(hashed_password)', per_lookup(
+                lambda i: db.find_user_by(hashed_password='hash{}'.format(i)),
+                keys[:SCANS])),
+        ]
+        for name, latency in results:
+            print('{:<30} {:>12.1f} us'.format(name, latency))
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
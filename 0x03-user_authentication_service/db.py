@@ -1,36 +1,91 @@
 #!/usr/bin/env python3
 """DB module doc
 """
-from sqlalchemy import create_engine
+import os
+from datetime import datetime
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.session import Session
-from typing import Any
-from user import Base, User
+from sqlalchemy.pool import StaticPool
+from typing import Any, Callable, Iterable, List, Tuple
+from user import Base, User, UserSession
+
+
+def _engine_options(url: str) -> dict:
+    """Returns the create_engine pool options fitting a database URL
+
+    In-memory SQLite lives in a single connection shared by every thread,
+    which suits tests but not concurrent writers. File SQLite uses
+    SQLAlchemy's default pool, and server databases get a sized pool
+    whose connections are checked before use.
+    """
+    if not url.startswith('sqlite'):
+        return {
+            'pool_size': int(os.getenv('USER_DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('USER_DB_MAX_OVERFLOW', 10)),
+            'pool_pre_ping': True,
+            'pool_recycle': int(os.getenv('USER_DB_POOL_RECYCLE', 1800)),
+        }
+    options = {'connect_args': {'check_same_thread': False}}
+    if make_url(url).database in (None, '', ':memory:'):
+        options['poolclass'] = StaticPool
+    return options
 
 
 class DB:
     """A DB class
+
+    Configured by the environment:
+      - USER_DB_URL: engine URL, `sqlite:///a.db` by default
+      - USER_DB_MODE: `production` keeps the existing tables and turns
+        the SQL echo off, otherwise tables are recreated on startup
+      - USER_DB_ECHO: forces the SQL echo on (1) or off (0)
+
+    Each thread gets its own session, released by remove_session().
     """
 
     def __init__(self) -> None:
         """Initialize a new DB instance
         """
-        self._engine = create_engine("sqlite:///a.db", echo=True)
-        Base.metadata.drop_all(self._engine)
+        url = os.getenv('USER_DB_URL', 'sqlite:///a.db')
+        production = os.getenv('USER_DB_MODE') == 'production'
+        echo = os.getenv('USER_DB_ECHO')
+        echo = not production if echo is None else echo == '1'
+        self._engine = create_engine(url, echo=echo, **_engine_options(url))
+        if not production:
+            Base.metadata.drop_all(self._engine)
         Base.metadata.create_all(self._engine)
-        self.__session = None
+        self.migrate()
+        self.__session = scoped_session(sessionmaker(bind=self._engine))
+        self._update_listeners = []
+
+    def migrate(self) -> None:
+        """Creates the indexes missing from tables made by an older schema
+
+        create_all() skips existing tables, so databases such as an old
+        `a.db` get their indexes here. A unique index cannot be created
+        while duplicate values remain, which raises an IntegrityError.
+        """
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self._engine, checkfirst=True)
 
     @property
     def _session(self) -> Session:
-        """Memoized session object
+        """Session object of the current thread
+        """
+        return self.__session()
+
+    def remove_session(self) -> None:
+        """Closes the session of the current thread, returning its
+        connection to the pool
         """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """
@@ -42,12 +97,83 @@ class DB:
 
         Returns:
             User: A user object created and added to the database
+
+        Raises:
+            IntegrityError: if the email is already registered
         """
         user = User(email=email, hashed_password=hashed_password)
         self._session.add(user)
-        self._session.commit()
+        try:
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
+            raise
         return user
 
+    def _bulk_insert(self, upsert: bool):
+        """Returns the INSERT statement of add_users for the dialect
+
+        Rows whose email exists are skipped, or have their password
+        replaced when `upsert` is set. Dialects without such a clause
+        get a plain INSERT, failing on duplicates.
+        """
+        table = User.__table__
+        dialect = self._engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(
+                table)
+            if upsert:
+                return stmt.on_conflict_do_update(
+                    index_elements=[table.c.email],
+                    set_={'hashed_password': stmt.excluded.hashed_password})
+            return stmt.on_conflict_do_nothing(index_elements=[table.c.email])
+        if dialect in ('mysql', 'mariadb'):
+            stmt = mysql.insert(table)
+            if upsert:
+                return stmt.on_duplicate_key_update(
+                    hashed_password=stmt.inserted.hashed_password)
+            return stmt.prefix_with('IGNORE')
+        return insert(table)
+
+    def add_users(self, users: Iterable[dict], batch_size: int = 1000,
+                  upsert: bool = False) -> int:
+        """
+        Saves users in batches, one multi-row INSERT and commit per batch
+
+        Args:
+            users (Iterable[dict]): dicts with `email` and
+                `hashed_password`, consumed lazily
+            batch_size (int): number of rows per INSERT
+            upsert (bool): replace the password of existing emails
+                instead of skipping them
+
+        Returns:
+            int: the number of rows processed
+        """
+        stmt = self._bulk_insert(upsert)
+        count = 0
+        batch = []
+        for user in users:
+            batch.append({'email': user['email'],
+                          'hashed_password': user['hashed_password']})
+            if len(batch) >= batch_size:
+                count += self._insert_batch(stmt, batch)
+                batch = []
+        if batch:
+            count += self._insert_batch(stmt, batch)
+        return count
+
+    def _insert_batch(self, stmt, batch: list) -> int:
+        """Executes and commits one batch of add_users
+        """
+        try:
+            self._session.execute(stmt, batch)
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+        return len(batch)
+
     def find_user_by(self, **kwargs: Any) -> User:
         """
         Finds the first user matching the provided arguments
@@ -76,6 +202,7 @@ class DB:
         except NoResultFound:
             raise ValueError
 
+        session_id = user.session_id
         for key, value in kwargs.items():
             if hasattr(user, key):
                 setattr(user, key, value)
@@ -83,3 +210,100 @@ class DB:
                 raise ValueError
 
         self._session.commit()
+        for listener in self._update_listeners:
+            listener(user_id, session_id)
+
+    def on_update(self, listener: Callable[[int, str], None]) -> None:
+        """
+        Registers a function called after each update_user commit with
+        the user ID and the session ID the user had before the update
+        """
+        self._update_listeners.append(listener)
+
+    def add_session(self, user_id: int, session_id: str,
+                    now: datetime) -> UserSession:
+        """
+        Saves a new session of a user
+
+        Args:
+            user_id (int): The ID of the session user
+            session_id (str): The session ID
+            now (datetime): The creation time
+        """
+        session = UserSession(id=session_id, user_id=user_id,
+                              created_at=now, last_seen=now)
+        self._session.add(session)
+        self._session.commit()
+        return session
+
+    def find_session(self, session_id: str) -> Tuple[UserSession, User]:
+        """
+        Finds a session and its user in one query
+
+        Raises:
+            NoResultFound: if there is no such session
+        """
+        row = self._session.query(UserSession, User).join(
+            User, User.id == UserSession.user_id).filter(
+            UserSession.id == session_id).first()
+        if row is None:
+            raise NoResultFound('Not found')
+        return tuple(row)
+
+    def touch_session(self, session_id: str, now: datetime) -> int:
+        """
+        Sets the last use of a session
+
+        Returns:
+            int: 1 if the session was renewed, 0 if it no longer exists
+        """
+        count = self._session.execute(update(UserSession).where(
+            UserSession.id == session_id).values(last_seen=now)).rowcount
+        self._session.commit()
+        return count
+
+    def session_ids(self, user_id: int) -> List[str]:
+        """
+        Returns the IDs of the sessions of a user
+        """
+        return list(self._session.scalars(select(UserSession.id).where(
+            UserSession.user_id == user_id)))
+
+    def delete_sessions(self, user_id: int, session_id: str = None) -> int:
+        """
+        Removes one session of a user, or all of them if session_id is None
+
+        Returns:
+            int: the number of sessions removed
+        """
+        stmt = delete(UserSession).where(UserSession.user_id == user_id)
+        if session_id is not None:
+            stmt = stmt.where(UserSession.id == session_id)
+        count = self._session.execute(stmt).rowcount
+        self._session.commit()
+        return count
+
+    def delete_stale_sessions(self, seen_before: datetime,
+                              batch_size: int = 1000) -> int:
+        """
+        Removes the sessions last used before a time, `batch_size` rows
+        per transaction so writers are never blocked for long
+
+        Returns:
+            int: the number of sessions removed
+        """
+        total = 0
+        while True:
+            ids = list(self._session.scalars(
+                select(UserSession.id).where(
+                    UserSession.last_seen < seen_before).limit(batch_size)))
+            if not ids:
+                return total
+            # Sessions renewed since the SELECT are kept
+            self._session.execute(delete(UserSession).where(
+                UserSession.id.in_(ids),
+                UserSession.last_seen < seen_before))
+            self._session.commit()
+            total += len(ids)
+            if len(ids) < batch_size:
+                return total
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" Bulk import of users from CSV or JSON Lines files """
+
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Iterator
+
+# Importing into tables recreated on startup would be pointless
+os.environ.setdefault('USER_DB_MODE', 'production')
+
+from auth import Auth  # noqa: E402
+
+
+def read_users(path: str) -> Iterator[dict]:
+    """
+    Streams the users of a file, one dict per row
+
+    `.jsonl` files hold one JSON object per line, other files are CSV
+    with a header row. Rows need an `email` and either a `password` or a
+    bcrypt `hashed_password`.
+
+    Args:
+        path (str): the file to read
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def report(count: int, rate: float) -> None:
+    """ Prints the import progress on stderr """
+    print('\r{} users imported, {:.0f} rows/s'.format(count, rate),
+          end='', file=sys.stderr, flush=True)
+
+
+def main():
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description='Register users in bulk from a CSV or JSONL file')
+    parser.add_argument('input', help='CSV or .jsonl file of users')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000,
+                        help='rows hashed and inserted at once')
+    parser.add_argument('-j', '--workers', type=int,
+                        help='number of hashing processes')
+    parser.add_argument('-u', '--upsert', action='store_true',
+                        help='replace the password of existing users')
+    args = parser.parse_args()
+
+    Auth().register_users(read_users(args.input), args.batch_size,
+                          args.workers, args.upsert, report)
+    print(file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+""" Session cache module """
+
+from collections import namedtuple, OrderedDict
+import os
+import sqlite3
+import threading
+import time
+from typing import Union
+
+# What the app needs of the user behind a session, and when the
+# session was last renewed
+UserSnapshot = namedtuple('UserSnapshot',
+                          ['id', 'email', 'session_id', 'last_seen'])
+
+
+class SessionCache:
+    """
+    Bounded LRU mapping session IDs to user snapshots, optionally backed
+    by a SQLite file shared by every worker process of the host
+
+    Entries live `ttl` seconds. Invalidation only reaches the in-process
+    tier of the current process, so with several workers a session
+    destroyed or reaped through one worker is still served by the others
+    until their entry expires, or until they next renew the session and
+    find it gone. This is why `ttl` defaults to a few seconds: it bounds
+    how long a logout takes to reach every worker.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 5,
+                 path: str = None):
+        """
+        Initializes the cache
+
+        Args:
+            max_size (int): entries kept in process, 0 disables the cache
+            ttl (float): lifetime of an entry in seconds
+            path (str): SQLite file of the shared tier, None for none
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        # Bumped on each invalidation, see put()
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._local = threading.local()
+        if path is not None:
+            with self._conn() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS session_cache ("
+                    "session_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, "
+                    "email TEXT NOT NULL, last_seen REAL NOT NULL, "
+                    "expires_at REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """ Returns the shared tier connection of the current thread """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Union[UserSnapshot, None]:
+        """ Returns the cached user of a session, or None """
+        if self.max_size <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                user, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(session_id)
+                    return user
+                del self._entries[session_id]
+            generation = self.generation
+        if self.path is None:
+            return None
+        row = self._conn().execute(
+            "SELECT user_id, email, last_seen, expires_at FROM session_cache "
+            "WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None or row[3] <= now:
+            return None
+        user = UserSnapshot(row[0], row[1], session_id, row[2])
+        self._store(user, row[3], generation)
+        return user
+
+    def put(self, user: UserSnapshot, generation: int,
+            expires_at: float = None) -> None:
+        """
+        Caches the user of a session read from the database
+
+        `generation` is the value of self.generation taken before that
+        read. If a session was invalidated since, the snapshot may
+        predate the change and is dropped. The entry lives `ttl` seconds,
+        or until `expires_at` if that comes first.
+        """
+        if self.max_size <= 0:
+            return
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        else:
+            expires_at = min(expires_at, time.time() + self.ttl)
+        if not self._store(user, expires_at, generation):
+            return
+        if self.path is not None:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO session_cache "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (user.session_id, user.id, user.email, user.last_seen,
+                     expires_at))
+
+    def _store(self, user: UserSnapshot, expires_at: float,
+               generation: int) -> bool:
+        """ Adds an entry to the in-process tier unless invalidated """
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._entries[user.session_id] = (user, expires_at)
+            self._entries.move_to_end(user.session_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, session_id: str) -> None:
+        """ Forgets a session """
+        if session_id is None:
+            return
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(session_id, None)
+        if self.path is not None:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM session_cache WHERE session_id = ?",
+                             (session_id,))
+
+
+def session_cache_from_env() -> SessionCache:
+    """
+    Returns the session cache configured by the environment:
+      - SESSION_CACHE_SIZE: entries kept in process, 0 disables the cache
+      - SESSION_CACHE_TTL: lifetime of an entry in seconds (5 by
+        default), the longest a logout takes to reach other workers
+      - SESSION_CACHE_PATH: SQLite file of the shared tier, unset for none
+    """
+    return SessionCache(int(os.getenv('SESSION_CACHE_SIZE', 10000)),
+                        float(os.getenv('SESSION_CACHE_TTL', 5)),
+                        os.getenv('SESSION_CACHE_PATH'))
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+""" Signed session tokens module """
+from typing import Iterable, List, Union
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    Fixed-size set of strings answering "maybe present" or "absent"
+
+    Sized for `capacity` items at `error_rate` false positives; past
+    that capacity the false positive rate grows.
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01):
+        """ Initializes an empty filter """
+        self.size = max(8, int(-capacity * math.log(error_rate) /
+                               math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        """ Bit positions of an item, by double hashing """
+        digest = hashlib.sha256(item.encode()).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        step = int.from_bytes(digest[8:16], 'big') | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        """ Adds an item """
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        """ Whether the item may have been added """
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class RevocationList:
+    """
+    Revoked token IDs, kept until the tokens expire
+
+    Lookups go through a bloom filter, so tokens that were never revoked,
+    nearly all of them, are cleared in memory. Only possible matches are
+    checked against the exact set. It lives in memory by default. With a
+    `path`, it lives in a SQLite file shared by every worker of the host,
+    and each worker loads the revocations of the others into its filter
+    every `refresh` seconds.
+    """
+
+    def __init__(self, path: str = None, capacity: int = 100000,
+                 error_rate: float = 0.01, refresh: float = 5):
+        """ Initializes the list """
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._bloom = BloomFilter(capacity, error_rate)
+        # Exact set of the in-memory mode: token ID -> expiry
+        self._revoked = {}
+        self._loaded_at = 0
+        self._rebuilt_at = time.time()
+        if path is not None:
+            with self._conn() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+                    "token_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, "
+                    "revoked_at REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_revoked_at "
+                             "ON revoked_tokens (revoked_at)")
+            self._load()
+
+    def _conn(self) -> sqlite3.Connection:
+        """ Returns the connection of the current thread """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self) -> None:
+        """ Adds the revocations made since the last load to the filter,
+        rebuilding it without the expired ones from time to time
+        """
+        now = time.time()
+        rebuild = now - self._rebuilt_at > 100 * self.refresh
+        with self._conn() as conn:
+            if rebuild:
+                conn.execute("DELETE FROM revoked_tokens "
+                             "WHERE expires_at < ?", (now,))
+            rows = conn.execute(
+                "SELECT token_id FROM revoked_tokens WHERE revoked_at >= ?",
+                (0 if rebuild else self._loaded_at - self.refresh,))
+            bloom = BloomFilter(self.capacity, self.error_rate) \
+                if rebuild else self._bloom
+            for (token_id,) in rows:
+                bloom.add(token_id)
+        with self._lock:
+            self._bloom = bloom
+            self._loaded_at = now
+            if rebuild:
+                self._rebuilt_at = now
+
+    def revoke(self, token_id: str, expires_at: float) -> None:
+        """ Revokes a token until its expiry """
+        with self._lock:
+            self._bloom.add(token_id)
+            if self.path is None:
+                self._revoked[token_id] = expires_at
+                self._sweep()
+                return
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO revoked_tokens VALUES (?, ?, ?)",
+                (token_id, expires_at, time.time()))
+
+    def _sweep(self) -> None:
+        """ Rebuilds the in-memory filter without the expired tokens """
+        now = time.time()
+        if now - self._rebuilt_at <= 100 * self.refresh:
+            return
+        self._revoked = {token_id: expires_at for token_id, expires_at
+                         in self._revoked.items() if expires_at >= now}
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        for token_id in self._revoked:
+            self._bloom.add(token_id)
+        self._rebuilt_at = now
+
+    def is_revoked(self, token_id: str) -> bool:
+        """ Whether a token was revoked """
+        if self.path is not None and \
+                time.time() - self._loaded_at > self.refresh:
+            self._load()
+        with self._lock:
+            if token_id not in self._bloom:
+                return False
+            if self.path is None:
+                return token_id in self._revoked
+        return self._conn().execute(
+            "SELECT 1 FROM revoked_tokens WHERE token_id = ?",
+            (token_id,)).fetchone() is not None
+
+
+class TokenSigner:
+    """
+    Issues and verifies HMAC-SHA256 signed, expiring session tokens
+
+    A token is `<payload>.<signature>`, both base64url encoded, and its
+    payload carries the user ID, the expiry, a random token ID and the
+    ID of the signing key. Tokens are signed with the first key and
+    accepted with any of them: rotate by putting a new key first and
+    dropping the old one once its tokens have expired.
+    """
+
+    def __init__(self, keys: List[bytes], ttl: int = 86400,
+                 revocations: RevocationList = None):
+        """ Initializes the signer """
+        if not keys:
+            raise ValueError("At least one signing key is needed")
+        self.ttl = ttl
+        self.revocations = revocations or RevocationList()
+        self._keys = {self._key_id(key): key for key in keys}
+        self._signing_key_id = self._key_id(keys[0])
+
+    @staticmethod
+    def _key_id(key: bytes) -> str:
+        """ Short public identifier of a key """
+        return hashlib.sha256(key).hexdigest()[:8]
+
+    @staticmethod
+    def _b64encode(data: bytes) -> str:
+        """ Unpadded base64url text of bytes """
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _b64decode(text: str) -> bytes:
+        """ Bytes of an unpadded base64url text """
+        return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+    def _sign(self, key: bytes, payload: str) -> str:
+        """ Signature of a payload """
+        return self._b64encode(hmac.new(key, payload.encode('ascii'),
+                                        hashlib.sha256).digest())
+
+    def issue(self, user_id, **claims) -> str:
+        """
+        Returns a new token for a user
+
+        Extra claims are carried in the payload as they are, readable by
+        anyone holding the token.
+        """
+        claims.update({
+            'sub': user_id,
+            'exp': int(time.time()) + self.ttl,
+            'jti': self._b64encode(os.urandom(12)),
+            'kid': self._signing_key_id,
+        })
+        payload = self._b64encode(
+            json.dumps(claims, separators=(',', ':')).encode())
+        return "{}.{}".format(
+            payload, self._sign(self._keys[self._signing_key_id], payload))
+
+    def _decode(self, token: str) -> Union[dict, None]:
+        """ Returns the claims of a well signed, unexpired token """
+        # compare_digest() raises on non-ASCII text, forged or not
+        if not isinstance(token, str) or not token.isascii() or \
+                token.count('.') != 1:
+            return None
+        payload, signature = token.split('.')
+        try:
+            claims = json.loads(self._b64decode(payload))
+            key = self._keys.get(claims.get('kid'))
+            exp = float(claims.get('exp'))
+        except (ValueError, TypeError, AttributeError):
+            return None
+        if key is None or not hmac.compare_digest(
+                self._sign(key, payload), signature):
+            return None
+        if exp <= time.time():
+            return None
+        return claims
+
+    def verify(self, token: str) -> Union[dict, None]:
+        """ Returns the claims of a valid token, or None """
+        claims = self._decode(token)
+        if claims is None or self.revocations.is_revoked(claims['jti']):
+            return None
+        return claims
+
+    def revoke(self, token: str) -> bool:
+        """ Revokes a token, returns False if it was not valid """
+        claims = self._decode(token)
+        if claims is None:
+            return False
+        self.revocations.revoke(claims['jti'], float(claims['exp']))
+        return True
+
+
+def token_signer_from_env() -> TokenSigner:
+    """
+    Returns the token signer configured by the environment:
+      - SESSION_TOKEN_KEYS: comma separated secret keys, the first one
+        signs
+      - SESSION_DURATION: token lifetime in seconds, 24h if unset or 0
+      - SESSION_REVOCATION_PATH: SQLite file of the revocation list
+        shared by the workers, unset to keep it in memory
+    """
+    keys = [key.strip().encode() for key in
+            os.getenv('SESSION_TOKEN_KEYS', '').split(',') if key.strip()]
+    if not keys:
+        raise RuntimeError("Signed session tokens require SESSION_TOKEN_KEYS")
+    try:
+        ttl = int(os.getenv('SESSION_DURATION', 0))
+    except ValueError:
+        ttl = 0
+    return TokenSigner(keys, ttl if ttl > 0 else 86400, RevocationList(
+        os.getenv('SESSION_REVOCATION_PATH')))
@@ -2,7 +2,7 @@
 """ SQLAlchemy User model """
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
 
 Base = declarative_base()
 
@@ -15,13 +15,35 @@ class User(Base):
         id (int): The primary key column for user ID
         email (str): The column for user email (required)
         hashed_password (str): The column for an encrypted password
-        session_id (str): The unique id for a user session
+        session_id (str): The unique id of a user session, superseded by
+            the `sessions` table
         reset_token (str): A reset token column
     """
     __tablename__ = 'users'
 
     id: int = Column(Integer, primary_key=True)
-    email: str = Column(String(250), nullable=False)
+    email: str = Column(String(250), nullable=False, unique=True, index=True)
     hashed_password: str = Column(String(250), nullable=False)
-    session_id: str = Column(String(250))
-    reset_token: str = Column(String(250))
+    session_id: str = Column(String(250), unique=True, index=True)
+    reset_token: str = Column(String(250), index=True)
+
+
+class UserSession(Base):
+    """
+    Session module for a database `sessions`, a user can have several
+
+    Attributes:
+        id (str): The primary key column, the session ID
+        user_id (int): The column for the ID of the session user
+        created_at (datetime): The column for the session creation time
+        last_seen (datetime): The column for the last use of the session,
+            refreshed at most every few seconds; sessions expire a fixed
+            time after it
+    """
+    __tablename__ = 'sessions'
+
+    id: str = Column(String(36), primary_key=True)
+    user_id: int = Column(Integer, ForeignKey('users.id'), nullable=False,
+                          index=True)
+    created_at = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False, index=True)